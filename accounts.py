@@ -0,0 +1,135 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from dotenv import load_dotenv
+from pymongo.errors import PyMongoError
+from database import db
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Registry of the accounts posts are published for. One document per account:
+#   {'_id': '1', 'name': 'Deepanshu', 'enabled': True, 'max_concurrency': 2,
+#    'linkedin': {'access_token': ...},
+#    'twitter': {'api_key': ..., 'api_secret': ..., 'access_token': ..., 'access_token_secret': ...}}
+# Adding an account is an insert into this collection, not a code change. When seeding it,
+# the two original accounts must keep ids '1' and '2': posts created before the registry
+# target them through LEGACY_ACCOUNT_FLAGS, and their post_results are keyed 'account_1'
+# and 'account_2'. New accounts can use any id.
+account_documents = db['accounts']
+
+ACCOUNT_REGISTRY_TTL = int(os.environ.get('ACCOUNT_REGISTRY_TTL', 60))
+DEFAULT_ACCOUNT_CONCURRENCY = int(os.environ.get('DEFAULT_ACCOUNT_CONCURRENCY', 2))
+
+# Posts created before the registry chose accounts with these flags; the env accounts
+# below keep ids '1' and '2' so those posts and their post_results still line up
+LEGACY_ACCOUNT_FLAGS = {'post_for_deepanshu': '1', 'post_for_aryan': '2'}
+
+_registry = {'accounts': None, 'loaded_at': 0}
+_semaphores = {}
+_async_semaphores = {}
+_lock = threading.Lock()
+
+class Account:
+    def __init__(self, doc):
+        self.id = str(doc['_id'])
+        self.name = doc.get('name') or self.id
+        self.max_concurrency = int(doc.get('max_concurrency') or DEFAULT_ACCOUNT_CONCURRENCY)
+
+        linkedin = doc.get('linkedin') or {}
+        self.linkedin_token = linkedin.get('access_token')
+
+        twitter = doc.get('twitter') or {}
+        credentials = (twitter.get('api_key'), twitter.get('api_secret'),
+                       twitter.get('access_token'), twitter.get('access_token_secret'))
+        self.twitter_credentials = credentials if all(credentials) else None
+
+    @property
+    def semaphore(self):
+        # Caps this account's in-flight publishes; kept across registry reloads
+        with _lock:
+            semaphore = _semaphores.get(self.id)
+            if semaphore is None or semaphore[0] != self.max_concurrency:
+                semaphore = (self.max_concurrency, threading.BoundedSemaphore(self.max_concurrency))
+                _semaphores[self.id] = semaphore
+        return semaphore[1]
+
+    @property
+    def async_semaphore(self):
+        # The same limit for publishes on the async server's event loop
+        with _lock:
+            semaphore = _async_semaphores.get(self.id)
+            if semaphore is None or semaphore[0] != self.max_concurrency:
+                semaphore = (self.max_concurrency, asyncio.Semaphore(self.max_concurrency))
+                _async_semaphores[self.id] = semaphore
+        return semaphore[1]
+
+def env_account_documents():
+    # The original two accounts, configured through environment variables
+    return [
+        {
+            '_id': '1',
+            'name': 'Deepanshu',
+            'linkedin': {'access_token': os.environ.get('LINKEDIN_ACCESS_TOKEN')},
+            'twitter': {
+                'api_key': os.environ.get('TWITTER_API_KEY'),
+                'api_secret': os.environ.get('TWITTER_API_SECRET'),
+                'access_token': os.environ.get('TWITTER_ACCESS_TOKEN'),
+                'access_token_secret': os.environ.get('TWITTER_ACCESS_TOKEN_SECRET')
+            }
+        },
+        {
+            '_id': '2',
+            'name': 'Aryan',
+            'linkedin': {'access_token': os.environ.get('LINKEDIN_ACCESS_TOKEN_2')},
+            'twitter': {
+                'api_key': os.environ.get('TWITTER_API_KEY_2'),
+                'api_secret': os.environ.get('TWITTER_API_SECRET_2'),
+                'access_token': os.environ.get('TWITTER_ACCESS_TOKEN_2'),
+                'access_token_secret': os.environ.get('TWITTER_ACCESS_TOKEN_SECRET_2')
+            }
+        }
+    ]
+
+def load_accounts():
+    try:
+        docs = list(account_documents.find({'enabled': {'$ne': False}}).sort('_id', 1))
+    except PyMongoError as e:
+        logger.warning(f"Failed to load account registry, using environment accounts: {str(e)}")
+        docs = []
+    if not docs:
+        docs = env_account_documents()
+    missing = set(LEGACY_ACCOUNT_FLAGS.values()) - {str(doc['_id']) for doc in docs}
+    if missing:
+        logger.warning(f"Account registry has no accounts {sorted(missing)}; posts created before the "
+                       f"registry that target them will not be published")
+    return {account.id: account for account in map(Account, docs)}
+
+def get_accounts():
+    # Enabled accounts by id, reloaded from MongoDB at most every ACCOUNT_REGISTRY_TTL seconds
+    with _lock:
+        accounts = _registry['accounts']
+        fresh = accounts is not None and time.monotonic() - _registry['loaded_at'] < ACCOUNT_REGISTRY_TTL
+    if fresh:
+        return accounts
+
+    accounts = load_accounts()
+    with _lock:
+        _registry['accounts'] = accounts
+        _registry['loaded_at'] = time.monotonic()
+    return accounts
+
+def post_accounts(post):
+    # Account ids a post targets; None means every enabled account
+    if post.get('accounts') is not None:
+        return [str(account_id) for account_id in post['accounts']]
+    if any(flag in post for flag in LEGACY_ACCOUNT_FLAGS):
+        return [account_id for flag, account_id in LEGACY_ACCOUNT_FLAGS.items() if post.get(flag, True)]
+    return None
+
+def account_names():
+    # post_results keys ('account_<id>') to display names, for the dashboard
+    return {f"account_{account.id}": account.name for account in get_accounts().values()}
@@ -0,0 +1,233 @@
+import io
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from bson import ObjectId
+from bson.errors import InvalidId
+from werkzeug.test import EnvironBuilder
+from database import get_async_db
+from ideogram_generator import generate_image_async
+from publisher import publish_async, build_post_results, failed_targets, retry_after
+from job_queue import claim_post_async, lease_kept_async, outcome_update, release_post_async, worker_id
+from image_jobs import start_image_mirror
+from rendering import get_rendered
+from accounts import post_accounts
+import http_clients
+import metrics
+from metrics import span
+from app import app as flask_app, ensure_indexes
+
+logger = logging.getLogger(__name__)
+
+# Async serving mode. The publish routes, which spend nearly all their time waiting on
+# Ideogram, LinkedIn, X and MongoDB, run as coroutines, so one process keeps hundreds of
+# them in flight. Every other route is served by the Flask app on a thread pool.
+#   gunicorn async_app:app --bind 0.0.0.0:8080 --worker-class aiohttp.GunicornWebWorker
+# The sync server (gunicorn app:app) is unchanged and remains the fallback.
+ASYNC_FLASK_THREADS = int(os.environ.get('ASYNC_FLASK_THREADS', 16))
+# Read size when the Flask thread pulls a request body off the event loop
+FLASK_BODY_CHUNK_SIZE = 64 * 1024
+
+flask_executor = ThreadPoolExecutor(max_workers=ASYNC_FLASK_THREADS, thread_name_prefix='flask')
+routes = web.RouteTableDef()
+
+def posts():
+    return get_async_db()['posts']
+
+def parse_id(content_id):
+    try:
+        return ObjectId(content_id)
+    except InvalidId:
+        return None
+
+async def publish_content(content, owner, rendered, image_url, accounts):
+    # Same as publish_views.publish_content, on the event loop
+    previous_results = content.get('post_results')
+    with span('post_stage', path='on_demand', stage='publish'):
+        async with lease_kept_async(content['_id'], owner):
+            results = await publish_async(rendered, image_url, accounts, previous_results, content['_id'])
+    linkedin_results = list(results['linkedin'].values())
+    twitter_results = list(results['twitter'].values())
+
+    logger.info(f"LinkedIn post results: {linkedin_results}")
+    logger.info(f"Twitter post results: {twitter_results}")
+
+    post_results, overall_status = build_post_results(results, image_url, previous_results)
+    update, overall_status = outcome_update(content['_id'], content.get('attempts', 0) + 1, post_results,
+                                            overall_status, retry_after(results))
+
+    with span('post_stage', path='on_demand', stage='save'):
+        await posts().update_one({'_id': content['_id'], 'lease_owner': owner}, update)
+
+    return {
+        'status': overall_status,
+        'linkedin_results': linkedin_results,
+        'twitter_results': twitter_results,
+        'image_url': image_url
+    }
+
+async def claim_content(content_id, owner):
+    post_id = parse_id(content_id)
+    content = await claim_post_async(post_id, owner) if post_id else None
+    if content:
+        return content, None
+    if post_id and await posts().count_documents({'_id': post_id}, limit=1):
+        logger.info(f"Content {content_id} is already being published")
+        return None, web.json_response({'error': 'Post is already being published'}, status=409)
+    logger.error(f"Content not found for ID: {content_id}")
+    return None, web.json_response({'error': 'Content not found'}, status=404)
+
+@routes.post('/generate_and_post')
+async def generate_and_post(request):
+    form = await request.post()
+    content_id = form.get('content_id')
+    logger.info(f"Received generate_and_post request for content ID: {content_id}")
+
+    owner = worker_id()
+    with span('post_stage', path='on_demand', stage='claim'):
+        content, error = await claim_content(content_id, owner)
+    if error:
+        return error
+
+    try:
+        with span('post_stage', path='on_demand', stage='render'):
+            rendered = get_rendered(content)
+
+        image_url = content.get('image_url')
+        if not image_url:
+            prompt = content.get('image_prompt') or rendered['plain_text']
+            logger.info(f"Generating image for content: {prompt[:50]}...")
+            with span('post_stage', path='on_demand', stage='image'):
+                image_url = await generate_image_async(prompt)
+            await posts().update_one(
+                {'_id': content['_id']},
+                {'$set': {'image_url': image_url}, '$unset': {'image_variants': ''}}
+            )
+            start_image_mirror(content['_id'], image_url)
+        else:
+            logger.info(f"Using existing image: {image_url}")
+
+        return web.json_response(await publish_content(content, owner, rendered, image_url, post_accounts(content)))
+    except Exception as e:
+        logger.error(f"Error in generate_and_post: {str(e)}", exc_info=True)
+        await release_post_async(content['_id'], owner, content.get('status', 'Scheduled'))
+        return web.json_response({'error': str(e)}, status=500)
+
+@routes.post('/api/retry_failed/{content_id}')
+async def retry_failed(request):
+    content_id = request.match_info['content_id']
+    logger.info(f"Received retry_failed request for content ID: {content_id}")
+    # Check before claiming, so a click with nothing to retry doesn't use up an attempt
+    post_id = parse_id(content_id)
+    content = post_id and await posts().find_one({'_id': post_id}, {'post_results': 1})
+    if not content:
+        logger.error(f"Content not found for ID: {content_id}")
+        return web.json_response({'error': 'Content not found'}, status=404)
+    if not failed_targets(content.get('post_results')):
+        return web.json_response({'error': 'No failed targets to retry'}, status=400)
+
+    owner = worker_id()
+    content, error = await claim_content(content_id, owner)
+    if error:
+        return error
+
+    post_results = content.get('post_results') or {}
+    targets = failed_targets(post_results)
+    if not targets:
+        await release_post_async(content['_id'], owner, content.get('status', 'Scheduled'))
+        return web.json_response({'error': 'No failed targets to retry'}, status=400)
+
+    try:
+        rendered = get_rendered(content)
+        image_url = post_results.get('image_url') or content.get('image_url')
+        accounts = sorted({account for _, account in targets})
+        logger.info(f"Retrying failed targets: {targets}")
+        return web.json_response(await publish_content(content, owner, rendered, image_url, accounts))
+    except Exception as e:
+        logger.error(f"Error in retry_failed: {str(e)}", exc_info=True)
+        await release_post_async(content['_id'], owner, content.get('status', 'Scheduled'))
+        return web.json_response({'error': str(e)}, status=500)
+
+@routes.get('/api/image_status/{content_id}')
+async def image_status(request):
+    post_id = parse_id(request.match_info['content_id'])
+    content = post_id and await posts().find_one(
+        {'_id': post_id},
+        {'image_url': 1, 'image_status': 1, 'image_error': 1}
+    )
+    if not content:
+        return web.json_response({'error': 'Content not found'}, status=404)
+
+    return web.json_response({
+        'image_status': content.get('image_status', 'ready' if content.get('image_url') else None),
+        'image_url': content.get('image_url'),
+        'error': content.get('image_error')
+    })
+
+@routes.get('/metrics')
+async def metrics_endpoint(request):
+    return web.Response(body=metrics.render().encode('utf-8'), headers={'Content-Type': 'text/plain; version=0.0.4'})
+
+def call_flask(environ):
+    return flask_app.response_class.from_app(flask_app.wsgi_app, environ, buffered=True)
+
+class RequestBodyReader(io.RawIOBase):
+    # wsgi.input for the Flask thread: each read waits for the next chunk of the aiohttp
+    # request body on the event loop, so uploads and imports stream instead of being buffered
+    def __init__(self, content, loop):
+        self.content = content
+        self.loop = loop
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = asyncio.run_coroutine_threadsafe(self.content.read(len(buffer)), self.loop).result()
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+async def flask_fallback(request):
+    # Hand the request to the Flask app as WSGI and relay its response. The body is streamed;
+    # Flask enforces its own size limits (MAX_CONTENT_LENGTH, per-endpoint overrides).
+    loop = asyncio.get_running_loop()
+    environ = EnvironBuilder(
+        path=request.path,
+        base_url=f"{request.scheme}://{request.host}",
+        query_string=request.query_string,
+        method=request.method,
+        headers=list(request.headers.items()),
+        environ_overrides={'REMOTE_ADDR': request.remote or ''}
+    ).get_environ()
+    # EnvironBuilder drops the body headers (and invents a multipart boundary) when it has no
+    # body of its own, so they are copied from the original request
+    if 'Content-Type' in request.headers:
+        environ['CONTENT_TYPE'] = request.headers['Content-Type']
+    environ['wsgi.input'] = io.BufferedReader(RequestBodyReader(request.content, loop), FLASK_BODY_CHUNK_SIZE)
+    # Chunked bodies have no Content-Length; the stream ends where the body does
+    if request.content_length is None:
+        environ['wsgi.input_terminated'] = True
+    else:
+        environ['CONTENT_LENGTH'] = str(request.content_length)
+    response = await loop.run_in_executor(flask_executor, call_flask, environ)
+    headers = [(name, value) for name, value in response.headers.items()
+               if name.lower() not in ('content-length', 'transfer-encoding')]
+    return web.Response(status=response.status_code, headers=headers, body=response.get_data())
+
+async def close_clients(app):
+    await http_clients.close_async_session()
+
+def create_app():
+    # A long-running server, so the indexes are ensured up front rather than on first request
+    ensure_indexes()
+    app = web.Application(client_max_size=flask_app.config['MAX_CONTENT_LENGTH'])
+    app.add_routes(routes)
+    app.router.add_route('*', '/{path:.*}', flask_fallback)
+    app.on_cleanup.append(close_clients)
+    return app
+
+app = create_app()
+
+if __name__ == '__main__':
+    web.run_app(app, host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
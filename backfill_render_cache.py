@@ -0,0 +1,47 @@
+import sys
+import logging
+import argparse
+from pymongo import UpdateOne
+from database import db
+from rendering import RENDERER_VERSION, render_post
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger(__name__)
+
+collection = db['posts']
+
+def backfill(batch_size=500):
+    # Store renders for posts that have none or were rendered by an older renderer version
+    updated = 0
+    operations = []
+    query = {'$or': [
+        {'rendered': {'$exists': False}},
+        {'rendered.version': {'$ne': RENDERER_VERSION}}
+    ]}
+    for post in collection.find(query, {'text': 1, 'rendered': 1}):
+        if 'text' not in post:
+            continue
+        operations.append(UpdateOne({'_id': post['_id']}, {'$set': {'rendered': render_post(post['text'])}}))
+        if len(operations) >= batch_size:
+            updated += collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        updated += collection.bulk_write(operations, ordered=False).modified_count
+    return updated
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill the rendered-text cache on posts')
+    parser.add_argument('--batch-size', type=int, default=500, help='updates per bulk write')
+    args = parser.parse_args()
+
+    updated = backfill(args.batch_size)
+    logger.info(f"Backfilled rendered text on {updated} post(s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# Microbenchmark: the single-pass structural html_to_plain_text vs. the original five-pass
+# regex version it replaced. The single pass also numbers and indents lists and keeps link
+# URLs, so it is slower per call; markdown.markdown, which runs first, is shown for scale.
+# Run from the repository root: python benchmarks/plain_text.py
+import os
+import re
+import sys
+import timeit
+import argparse
+from html import unescape
+import markdown
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rendering import html_to_plain_text
+
+SAMPLE_POST = """**Shipping faster with smaller PRs**
+
+Most teams I work with review code the same way they did five years ago.
+Here is what changed for us:
+
+- Keep PRs under 200 lines
+- Review within 4 hours
+    - even if it's just a quick *LGTM*
+- Automate the boring checks
+
+1. Write the test
+2. Make it pass
+3. Ship it
+
+## What we measured
+
+Lead time dropped by 40% & review quality went up. Details in [our write-up](https://example.com/post?id=1&ref=li).
+
+    git log --since=2.weeks --oneline | wc -l
+
+What does your review process look like? 👇
+"""
+
+def legacy_html_to_plain_text(html_content):
+    text = re.sub(r'<br\s*/?>', '\n', html_content)
+    text = re.sub(r'</p>', '\n', text)
+    text = re.sub(r'<li>', '• ', text)
+    text = re.sub(r'<[^>]+>', '', text)
+    text = unescape(text)
+    text = re.sub(r'\n\s*\n', '\n\n', text)
+    return text.strip()
+
+def bench(func, html_content, number, repeat):
+    timings = timeit.repeat(lambda: func(html_content), number=number, repeat=repeat)
+    return min(timings) / number * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark markdown HTML to plain text conversion')
+    parser.add_argument('--number', type=int, default=2000, help='calls per timing run')
+    parser.add_argument('--repeat', type=int, default=5, help='timing runs (best is reported)')
+    parser.add_argument('--scale', type=int, default=1, help='repeat the sample post to simulate longer posts')
+    args = parser.parse_args()
+
+    html_content = markdown.markdown('\n\n'.join([SAMPLE_POST] * args.scale))
+    print(f"Input: {len(html_content)} bytes of HTML")
+    for name, func in [('legacy (5 regex passes)', legacy_html_to_plain_text), ('single pass', html_to_plain_text)]:
+        print(f"{name:>24}: {bench(func, html_content, args.number, args.repeat):8.1f} us/call")
+
+    # For scale: the markdown render that precedes either converter
+    source = '\n\n'.join([SAMPLE_POST] * args.scale)
+    print(f"{'markdown.markdown':>24}: {bench(markdown.markdown, source, max(args.number // 10, 1), args.repeat):8.1f} us/call")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# Cold-start benchmark: each scenario runs in a fresh interpreter under python -X importtime,
+# imports app.py and serves one request, the way every Vercel invocation starts. Reports
+# the wall time to the first response, the time spent importing and the heaviest packages.
+# MongoDB is mongomock unless --mongo points at a local mongod; mongomock and pymongo are
+# then imported before the clock starts, so every scenario under-reports by the pymongo
+# import. Compare against another checkout (e.g. a git worktree) with --root.
+# Run from the repository root: python benchmarks/startup.py --runs 5
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (name, path, extra environment)
+SCENARIOS = [
+    ('import app', None, {}),
+    ('static page /ads', '/ads', {}),
+    ('static page /skool', '/skool', {}),
+    ('cron (worker enabled)', '/api/process_scheduled_posts', {'PUBLISH_WORKER_ENABLED': 'true'}),
+    ('cron (nothing due)', '/api/process_scheduled_posts', {'PUBLISH_WORKER_ENABLED': 'false'}),
+    ('dashboard /', '/', {}),
+]
+
+BEGIN = 'startup-benchmark-begin'
+END = 'startup-benchmark-end'
+
+PROGRAM = '''
+import sys, time
+if {mock!r}:
+    import mongomock, pymongo
+    pymongo.MongoClient = mongomock.MongoClient
+sys.stderr.write({begin!r} + '\\n')
+start = time.perf_counter()
+import app
+status = 0
+if {path!r}:
+    status = app.app.test_client().get({path!r}).status_code
+sys.stderr.write(f"{end} {{status}} {{time.perf_counter() - start}}\\n")
+'''
+
+def parse_importtime(lines):
+    # Total import time of the modules imported after the marker (top-level entries only,
+    # nested ones are part of their parent's cumulative time) and self time per package
+    total = 0
+    packages = defaultdict(int)
+    count = 0
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        count += 1
+        packages[name.strip().split('.')[0]] += int(self_us)
+        # Nested imports are indented under their parent
+        if not name[1:].startswith(' '):
+            total += int(cumulative_us)
+    return total / 1000, {package: us / 1000 for package, us in packages.items()}, count
+
+def run_scenario(root, path, mock, env):
+    program = PROGRAM.format(mock=mock, path=path, begin=BEGIN, end=END)
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', program], cwd=root,
+                               env=env, capture_output=True, text=True)
+    lines = completed.stderr.splitlines()
+    if BEGIN not in lines or not any(line.startswith(END) for line in lines):
+        sys.exit(f"Scenario failed in {root}:\n{completed.stderr[-2000:]}")
+    begin = lines.index(BEGIN)
+    end = next(i for i, line in enumerate(lines) if line.startswith(END))
+    _, status, elapsed = lines[end].split()
+    import_ms, packages, modules = parse_importtime(lines[begin + 1:end])
+    return {'status': int(status), 'wall_ms': float(elapsed) * 1000, 'import_ms': import_ms,
+            'modules': modules, 'packages': packages}
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold-start time of app.py per route')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per scenario')
+    parser.add_argument('--root', default=ROOT, help='checkout to measure (defaults to this one)')
+    parser.add_argument('--mongo', default='mongomock', help="'mongomock' or the URI of a local mongod")
+    parser.add_argument('--top', type=int, default=3, help='heaviest packages to list per scenario')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    base_env = dict(os.environ)
+    base_env.update({
+        'MONGO_URI': 'mongodb://localhost:27017' if args.mongo == 'mongomock' else args.mongo,
+        'STORAGE_BACKEND': 'local',
+        'PYTHONDONTWRITEBYTECODE': '1'
+    })
+
+    results = []
+    print(f"{'scenario':<24} {'status':>6} {'wall ms':>9} {'import ms':>10} {'modules':>8}  heaviest packages")
+    for name, path, extra_env in SCENARIOS:
+        env = dict(base_env, **extra_env)
+        runs = [run_scenario(args.root, path, args.mongo == 'mongomock', env)
+                for _ in range(args.runs)]
+        packages = defaultdict(list)
+        for run in runs:
+            for package, ms in run['packages'].items():
+                packages[package].append(ms)
+        heaviest = sorted(packages, key=lambda package: -statistics.median(packages[package]))[:args.top]
+        result = {
+            'scenario': name,
+            'status': runs[0]['status'],
+            'wall_ms': statistics.median(run['wall_ms'] for run in runs),
+            'import_ms': statistics.median(run['import_ms'] for run in runs),
+            'modules': runs[0]['modules'],
+            'heaviest': {package: statistics.median(packages[package]) for package in heaviest}
+        }
+        results.append(result)
+        print(f"{name:<24} {result['status']:>6} {result['wall_ms']:>9.1f} {result['import_ms']:>10.1f} "
+              f"{result['modules']:>8}  " + ', '.join(f"{package} {ms:.0f}" for package, ms in result['heaviest'].items()))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
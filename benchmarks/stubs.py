@@ -0,0 +1,144 @@
+# Local stand-ins for the Ideogram, LinkedIn and X APIs, served from one threaded HTTP
+# server with configurable latency and error rate. Used by benchmarks/suite.py.
+import io
+import json
+import time
+import random
+import struct
+import zlib
+import itertools
+import threading
+from urllib.parse import urlsplit, urlunsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from requests.adapters import HTTPAdapter
+
+# Hosts the application talks to; requests for them are redirected to the stub server
+STUBBED_HOSTS = ('api.linkedin.com', 'api.ideogram.ai', 'api.twitter.com', 'upload.twitter.com')
+
+def tiny_png(width=64, height=64):
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    rows = b''.join(b'\x00' + b'\x80\x40\x20' * width for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows))
+            + chunk(b'IEND', b''))
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_stub(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.requests += 1
+        if server.error_rate and random.random() < server.error_rate:
+            return self.send_json(503, {'error': 'stubbed failure'})
+
+        path = urlsplit(self.path).path
+        next_id = str(next(server.ids))
+        if path == '/image.png':
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(server.image)))
+            self.end_headers()
+            self.wfile.write(server.image)
+        elif path == '/generate':
+            self.send_json(200, {'data': [{'url': f"{server.base_url}/image.png?id={next_id}"}]})
+        elif path == '/v2/userinfo':
+            self.send_json(200, {'sub': 'benchmark'})
+        elif path == '/v2/assets':
+            self.send_json(200, self.register_upload(body, next_id))
+        elif path.startswith('/upload/'):
+            self.send_response(201)
+            self.send_header('ETag', f'"{next_id}"')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif path == '/v2/ugcPosts':
+            self.send_json(201, {'id': f"urn:li:share:{next_id}"})
+        elif path == '/1.1/media/upload.json':
+            self.send_json(200, {'media_id': int(next_id), 'media_id_string': next_id, 'expires_after_secs': 86400})
+        elif path == '/2/tweets':
+            self.send_json(201, {'data': {'id': next_id, 'text': ''}})
+        else:
+            self.send_json(404, {'error': f"no stub for {path}"})
+
+    def register_upload(self, body, next_id):
+        # Large uploads that ask for it get LinkedIn's multipart mechanism, in 3 parts
+        request = json.loads(body or b'{}').get('registerUploadRequest') or {}
+        value = {'asset': f"urn:li:digitalmediaAsset:{next_id}", 'mediaArtifact': f"urn:li:digitalmediaMediaArtifact:{next_id}"}
+        if 'MULTIPART_UPLOAD' in request.get('supportedUploadMechanism', []):
+            size = request['fileSize']
+            bounds = [size * i // 3 for i in range(4)]
+            value['uploadMechanism'] = {'com.linkedin.digitalmedia.uploading.MultipartUpload': {
+                'metadata': f"metadata-{next_id}",
+                'partUploadRequests': [{
+                    'url': f"{self.server.base_url}/upload/{next_id}-{i}",
+                    'byteRange': {'firstByte': bounds[i], 'lastByte': bounds[i + 1] - 1},
+                    'headers': {'Content-Type': 'application/octet-stream'}
+                } for i in range(3)]
+            }}
+        else:
+            value['uploadMechanism'] = {'com.linkedin.digitalmedia.uploading.MediaUploadHttpRequest': {
+                'uploadUrl': f"{self.server.base_url}/upload/{next_id}"
+            }}
+        return {'value': value}
+
+    do_GET = do_POST = do_PUT = handle_stub
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, error_rate=0.0):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.image = tiny_png()
+        self.base_url = f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='stub-server', daemon=True).start()
+        return self
+
+class RedirectAdapter(HTTPAdapter):
+    # Sends requests for the real API hosts to the stub server instead
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.target = urlsplit(base_url)
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        if url.hostname in STUBBED_HOSTS:
+            request.url = urlunsplit((self.target.scheme, self.target.netloc, url.path, url.query, url.fragment))
+        return super().send(request, **kwargs)
+
+def redirect_session(session, base_url, pool_size=16):
+    adapter = RedirectAdapter(base_url, pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def sample_csv(rows):
+    # A bulk import file with `rows` posts
+    buffer = io.StringIO()
+    buffer.write('text,image_prompt\n')
+    for i in range(rows):
+        buffer.write(f"\"Benchmark import post {i}\n\nWith **markdown** and a [link](https://example.com/{i})\",\n")
+    return io.BytesIO(buffer.getvalue().encode('utf-8'))
@@ -0,0 +1,218 @@
+# End-to-end benchmark: dashboard render, slot allocation, bulk import and publish fan-out
+# through the real app.py routes and social_media_poster, with every external service
+# stood in for locally. MongoDB is mongomock (pip install mongomock) unless --mongo points
+# at a local mongod; Ideogram, LinkedIn and X are served by benchmarks/stubs.py; Spaces is
+# replaced by the local storage backend in a temp directory. mongomock scans instead of using
+# indexes, so compare large sizes against a local mongod before reading much into them.
+# Run from the repository root: python benchmarks/suite.py --sizes 10,1000
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import argparse
+import statistics
+from datetime import datetime, timedelta
+import pytz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import StubServer, redirect_session, sample_csv
+
+# Collections the suite fills; emptied before each size
+COLLECTIONS = ['posts', 'slot_reservations', 'publish_calls', 'rate_limits', 'media_files', 'linkedin_identities']
+
+def configure_environment(args):
+    # Must run before the app modules are imported: they read their settings at import time
+    if args.mongo == 'mongomock':
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("mongomock is not installed; pip install mongomock or pass --mongo mongodb://localhost:27017")
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+    os.environ['MONGO_URI'] = 'mongodb://localhost:27017' if args.mongo == 'mongomock' else args.mongo
+
+    os.environ['STORAGE_BACKEND'] = 'local'
+    os.environ['LOCAL_STORAGE_DIR'] = tempfile.mkdtemp(prefix='benchmark-storage-')
+    os.environ['IDEOGRAM_API_KEY'] = 'benchmark'
+    # Measure the app, not the token buckets
+    for platform in ('LINKEDIN', 'TWITTER'):
+        os.environ[f'RATE_LIMIT_{platform}_CAPACITY'] = '1000000000'
+    for suffix in ('', '_2'):
+        os.environ[f'LINKEDIN_ACCESS_TOKEN{suffix}'] = f'benchmark-linkedin{suffix}'
+        for name in ('API_KEY', 'API_SECRET', 'ACCESS_TOKEN', 'ACCESS_TOKEN_SECRET'):
+            os.environ[f'TWITTER_{name}{suffix}'] = f'benchmark-{name.lower()}{suffix}'
+
+def wire_stubs(stub):
+    # Route every outbound session through the stub server
+    import http_clients
+
+    get_session = http_clients.get_session
+    get_twitter_clients = http_clients.get_twitter_clients
+
+    def stubbed_session(url):
+        session = get_session(url)
+        if not getattr(session, 'benchmark_stubbed', False):
+            redirect_session(session, stub.base_url, http_clients.HTTP_POOL_SIZE)
+            session.benchmark_stubbed = True
+        return session
+
+    def stubbed_twitter_clients(credentials):
+        client, api = get_twitter_clients(credentials)
+        for session in (client.session, api.session):
+            if not getattr(session, 'benchmark_stubbed', False):
+                redirect_session(session, stub.base_url, http_clients.HTTP_POOL_SIZE)
+                session.benchmark_stubbed = True
+        return client, api
+
+    http_clients.get_session = stubbed_session
+    http_clients.get_twitter_clients = stubbed_twitter_clients
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def measure(name, size, func, iterations):
+    timings = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        start = time.perf_counter()
+        func(i)
+        timings.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started
+    return {
+        'scenario': name,
+        'posts': size,
+        'ops': iterations,
+        'ops_per_second': iterations / elapsed if elapsed else float('inf'),
+        'p50_ms': percentile(timings, 0.5) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'mean_ms': statistics.mean(timings) * 1000
+    }
+
+def seed_posts(collection, size, queued, render_post):
+    # History posts in past slots plus `queued` scheduled posts in the next upcoming slots,
+    # the shape a long-running deployment has
+    from slots import free_slots, SLOT_HOURS
+
+    rendered = render_post("Benchmark post\n\nWith **markdown** and a [link](https://example.com).")
+    post_results = {
+        'linkedin': {'account_1': 'Success', 'account_2': 'Success'},
+        'twitter': {'account_1': 'Success', 'account_2': 'Success'}
+    }
+    now = datetime.now(pytz.UTC)
+    history = max(size - queued, 0)
+    batch = []
+    for i in range(history):
+        day, slot = divmod(i, len(SLOT_HOURS))
+        batch.append({
+            'text': f"History post {i}",
+            'rendered': rendered,
+            'scheduled_time': now - timedelta(days=day + 1, hours=slot * 7),
+            'status': 'Success',
+            'image_url': f"https://example.com/history/{i}.png",
+            'post_results': post_results
+        })
+        if len(batch) >= 1000:
+            collection.insert_many(batch)
+            batch = []
+
+    upcoming = free_slots()
+    for i in range(min(size, queued)):
+        batch.append({
+            'text': f"Queued post {i}\n\nWith **markdown** and a [link](https://example.com/{i}).",
+            'rendered': rendered,
+            'scheduled_time': next(upcoming).astimezone(pytz.UTC),
+            'status': 'Scheduled',
+            'image_url': None,
+            'image_prompt': f"Benchmark image {i}"
+        })
+        if len(batch) >= 1000:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+
+def run_size(size, args, app_module, db):
+    from slots import reserve_next_slot
+    from bulk_import import import_posts
+    from rendering import render_post
+
+    for name in COLLECTIONS:
+        db[name].delete_many({})
+    seed_started = time.perf_counter()
+    seed_posts(db['posts'], size, args.queued, render_post)
+    print(f"Seeded {size} posts in {time.perf_counter() - seed_started:.1f}s", file=sys.stderr)
+
+    client = app_module.app.test_client()
+    results = []
+
+    def dashboard(i):
+        response = client.get('/')
+        assert response.status_code == 200, response.status_code
+    results.append(measure('dashboard render', size, dashboard, args.iterations))
+
+    results.append(measure('slot allocation', size, lambda i: reserve_next_slot(), args.iterations))
+
+    def bulk_import(i):
+        summary = import_posts(sample_csv(args.import_rows), 'csv')
+        assert summary['imported'] == args.import_rows, summary
+    results.append(measure(f'bulk import ({args.import_rows} rows)', size, bulk_import, args.import_iterations))
+
+    queued = [str(post['_id']) for post in db['posts'].find(
+        {'status': 'Scheduled', 'image_prompt': {'$ne': None}}, {'_id': 1}).limit(args.iterations)]
+    random.shuffle(queued)
+
+    def publish(i):
+        response = client.post('/generate_and_post', data={'content_id': queued[i]})
+        assert response.status_code == 200, response.get_data(as_text=True)
+    results.append(measure('publish fan-out', size, publish, len(queued)))
+    return results
+
+def print_table(results):
+    print(f"{'scenario':<26} {'posts':>7} {'ops':>5} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for result in results:
+        print(f"{result['scenario']:<26} {result['posts']:>7} {result['ops']:>5} {result['ops_per_second']:>9.1f} "
+              f"{result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the app end to end against local stand-ins')
+    parser.add_argument('--sizes', default='10,1000,100000', help='comma-separated post counts to seed')
+    parser.add_argument('--iterations', type=int, default=20, help='operations per scenario')
+    parser.add_argument('--queued', type=int, default=300, help='scheduled posts among the seeded ones')
+    parser.add_argument('--import-rows', type=int, default=200, help='rows per bulk import')
+    parser.add_argument('--import-iterations', type=int, default=3, help='bulk imports per size')
+    parser.add_argument('--latency-ms', type=float, default=0, help='added latency of every stubbed API call')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of stubbed API calls that fail with 503')
+    parser.add_argument('--mongo', default='mongomock',
+                        help="'mongomock' or the URI of a throwaway mongod (its content_database is emptied)")
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    configure_environment(args)
+    stub = StubServer(args.latency_ms / 1000, args.error_rate).start()
+    wire_stubs(stub)
+
+    import logging
+    import app as app_module
+    from database import db
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.mongo != 'mongomock' and db['posts'].estimated_document_count():
+        sys.exit(f"{args.mongo} already has posts in content_database; use an empty, throwaway mongod")
+
+    results = []
+    for size in (int(value) for value in args.sizes.split(',')):
+        results.extend(run_size(size, args, app_module, db))
+    print_table(results)
+    print(f"Stub server handled {stub.requests} requests", file=sys.stderr)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+import codecs
+import os
+import csv
+import json
+import logging
+from datetime import datetime
+import pytz
+from pymongo.errors import BulkWriteError, PyMongoError
+from database import db
+from slots import release_slot, reserve_slots
+from rendering import render_post
+from accounts import LEGACY_ACCOUNT_FLAGS
+
+logger = logging.getLogger(__name__)
+
+collection = db['posts']
+
+# Rows are read, slotted and written in batches so memory stays flat for large imports
+BULK_IMPORT_BATCH_SIZE = int(os.environ.get('BULK_IMPORT_BATCH_SIZE', 200))
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+# Value types accepted per column; JSONL rows can carry anything JSON can
+TEXT_TYPES = (str,)
+OPTIONAL_TEXT_TYPES = (str, type(None))
+FLAG_TYPES = (bool, int, float, str, type(None))
+ACCOUNT_ID_TYPES = (int, str)
+
+def parse_bool(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+def parse_accounts(row):
+    # Account ids from an 'accounts' column (comma separated in CSV, a list in JSONL), or the
+    # legacy post_for_* columns; None targets every enabled account
+    value = row.get('accounts')
+    if isinstance(value, list):
+        return [str(account_id) for account_id in value]
+    if value:
+        return [account_id.strip() for account_id in str(value).split(',') if account_id.strip()]
+    if any(row.get(flag) not in (None, '') for flag in LEGACY_ACCOUNT_FLAGS):
+        return [account_id for flag, account_id in LEGACY_ACCOUNT_FLAGS.items() if parse_bool(row.get(flag), True)]
+    return None
+
+def detect_format(filename=None, content_type=None):
+    filename = (filename or '').lower()
+    content_type = (content_type or '').lower()
+    if filename.endswith('.csv') or 'csv' in content_type:
+        return 'csv'
+    return 'jsonl'
+
+def iter_rows(stream, fmt):
+    # Yield (line_number, row) pairs from a binary stream without reading it all into memory
+    text_stream = codecs.getreader('utf-8-sig')(stream)
+    if fmt == 'csv':
+        reader = csv.DictReader(text_stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(text_stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, {'_error': f'Invalid JSON: {str(e)}'}
+
+def row_error(row):
+    # Why a row can't be imported, or None; checked before the row takes a slot
+    if not isinstance(row, dict):
+        return 'Expected an object per line'
+    if '_error' in row:
+        return row['_error']
+    text = row.get('text')
+    if text is not None and not isinstance(text, TEXT_TYPES):
+        return 'text must be a string'
+    if not (text or '').strip():
+        return 'Missing text'
+    for field in ('image_url', 'image_prompt'):
+        if not isinstance(row.get(field), OPTIONAL_TEXT_TYPES):
+            return f'{field} must be a string'
+    for field in ('generate_image', *LEGACY_ACCOUNT_FLAGS):
+        if not isinstance(row.get(field), FLAG_TYPES):
+            return f'{field} must be a boolean'
+    accounts = row.get('accounts')
+    if isinstance(accounts, list):
+        if not all(isinstance(account_id, ACCOUNT_ID_TYPES) and not isinstance(account_id, bool)
+                   for account_id in accounts):
+            return 'accounts must be a list of account ids'
+    elif not isinstance(accounts, ACCOUNT_ID_TYPES + (type(None),)) or isinstance(accounts, bool):
+        return 'accounts must be a list of account ids'
+    return None
+
+def build_post(row):
+    image_url = row.get('image_url') or None
+    image_prompt = row.get('image_prompt') or None
+    post = {
+        'text': row['text'],
+        'rendered': render_post(row['text']),
+        'status': 'Scheduled',
+        'image_url': image_url,
+        'image_prompt': image_prompt,
+        'accounts': parse_accounts(row)
+    }
+    # Image generation is deferred to the background image stage
+    if not image_url and (image_prompt or parse_bool(row.get('generate_image'), False)):
+        post['image_status'] = 'pending'
+    return post
+
+def uninserted(posts):
+    # Indexes of the posts that are not in the collection after a failed insert_many, or
+    # None if that can't be checked. insert_many gives each document its _id before sending
+    # it, so a post without one was never sent.
+    ids = [post['_id'] for post in posts if '_id' in post]
+    try:
+        found = {doc['_id'] for doc in collection.find({'_id': {'$in': ids}}, {'_id': 1})} if ids else set()
+    except PyMongoError as e:
+        logger.error(f"Could not check which imported posts were written: {str(e)}")
+        return None
+    return [index for index, post in enumerate(posts) if post.get('_id') not in found]
+
+def write_batch(rows, summary):
+    # rows are (line_number, row) pairs. A row that fails to build or insert is reported
+    # and its slot released; the rest of the batch is still imported. If the insert fails
+    # part way (e.g. the connection drops), the rows that did reach the collection count as
+    # imported and keep their slots before the error is re-raised.
+    posts, lines, errors = [], [], []
+    for line_number, row in rows:
+        try:
+            posts.append(build_post(row))
+            lines.append(line_number)
+        except Exception as e:
+            errors.append({'line': line_number, 'error': str(e)})
+    if not posts:
+        summary['errors'].extend(errors)
+        return
+
+    scheduled_times = reserve_slots(len(posts))
+    for post, scheduled_time in zip(posts, scheduled_times):
+        post['scheduled_time'] = scheduled_time.astimezone(pytz.UTC)
+    failed = {}      # index -> error; these slots are released
+    unknown = []     # indexes whose insert can't be confirmed; their slots are kept
+    try:
+        collection.insert_many(posts, ordered=False)
+    except BulkWriteError as e:
+        failed = {error['index']: error.get('errmsg', 'Insert failed') for error in e.details.get('writeErrors', [])}
+    except Exception:
+        missing = uninserted(posts)
+        if missing is None:
+            unknown = list(range(len(posts)))
+        else:
+            failed = {index: 'Not imported, the import was aborted' for index in missing}
+        raise
+    finally:
+        for index, message in failed.items():
+            release_slot(scheduled_times[index])
+            errors.append({'line': lines[index], 'error': message})
+        errors.extend({'line': lines[index], 'error': 'The import was aborted; this row may not have been imported'}
+                      for index in unknown)
+        summary['errors'].extend(sorted(errors, key=lambda error: error['line']))
+
+        inserted = [post for index, post in enumerate(posts) if index not in failed and index not in unknown]
+        summary['imported'] += len(inserted)
+        summary['pending_images'] += sum(1 for post in inserted if post.get('image_status') == 'pending')
+
+def import_posts(stream, fmt):
+    # Never raises for bad input: invalid rows are listed in 'errors', and a failure that stops
+    # the import part way (unreadable stream, database down) is reported in 'aborted' next to
+    # what was imported before it
+    summary = {'imported': 0, 'pending_images': 0, 'errors': []}
+    batch = []
+    started = datetime.now(pytz.UTC)
+
+    try:
+        for line_number, row in iter_rows(stream, fmt):
+            error = row_error(row)
+            if error:
+                summary['errors'].append({'line': line_number, 'error': error})
+                continue
+            batch.append((line_number, row))
+            if len(batch) >= BULK_IMPORT_BATCH_SIZE:
+                # write_batch reports its own rows if it fails
+                rows, batch = batch, []
+                write_batch(rows, summary)
+
+        if batch:
+            rows, batch = batch, []
+            write_batch(rows, summary)
+    except Exception as e:
+        logger.error(f"Bulk import aborted: {str(e)}", exc_info=True)
+        summary['aborted'] = str(e)
+        summary['errors'].extend({'line': line_number, 'error': 'Not imported, the import was aborted'}
+                                 for line_number, _ in batch)
+
+    elapsed = (datetime.now(pytz.UTC) - started).total_seconds()
+    logger.info(f"Bulk import finished: {summary['imported']} imported, {len(summary['errors'])} rejected in {elapsed:.2f}s")
+    return summary
@@ -0,0 +1,43 @@
+from flask import jsonify, request
+from job_queue import count_due_posts, run_due_posts
+from metrics import span
+import os
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Scheduled publishing
+PUBLISH_WORKER_ENABLED = os.environ.get('PUBLISH_WORKER_ENABLED', 'false').lower() == 'true'
+CRON_TIME_BUDGET_SECONDS = int(os.environ.get('CRON_TIME_BUDGET_SECONDS', 30))
+
+def process_scheduled_posts():
+    logger.info("Processing scheduled posts")
+
+    # With a standalone worker deployed the cron only reports the queue; the worker publishes
+    if PUBLISH_WORKER_ENABLED:
+        due_posts = count_due_posts()
+        logger.info(f"{due_posts} due post(s) queued for the publish worker")
+        return {'queued': due_posts}
+
+    # Otherwise publish inline, stopping before the serverless time limit; leftovers wait for the next run
+    with span('process_scheduled_posts'):
+        results = run_due_posts(deadline=time.monotonic() + CRON_TIME_BUDGET_SECONDS)
+    logger.info(f"Processed {len(results)} scheduled posts")
+    return results
+
+def trigger_cron():
+    results = process_scheduled_posts()
+    return jsonify(results)
+
+def run_cron():
+    # Verify the request using a secret key
+    secret_key = request.args.get('key')
+    if secret_key != os.environ.get('CRON_SECRET_KEY'):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        results = process_scheduled_posts()
+        return jsonify({"message": "Cron job completed", "results": results})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
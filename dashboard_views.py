@@ -0,0 +1,287 @@
+from flask import render_template, request, jsonify, redirect, url_for
+from pymongo import ASCENDING, DESCENDING
+from bson import ObjectId
+from bson.errors import InvalidId
+from database import db
+from slots import find_next_available_slot, reserve_next_slot, release_slot
+from image_jobs import start_pending_image_generation
+from bulk_import import detect_format, import_posts
+from storage import UploadRejected, upload_to_digitalocean
+from rendering import get_rendered, render_post
+from tweet_splitter import weighted_length
+from accounts import get_accounts, account_names
+import os
+import logging
+from datetime import datetime
+import pytz
+
+logger = logging.getLogger(__name__)
+
+# Dashboard and post management routes; loaded on the first request to one of them
+collection = db['posts']
+
+# Dashboard pagination
+DASHBOARD_PAGE_SIZE = int(os.environ.get('DASHBOARD_PAGE_SIZE', 50))
+DASHBOARD_PROJECTION = {
+    'text': 1,
+    'rendered': 1,
+    'scheduled_time': 1,
+    'status': 1,
+    'image_url': 1,
+    'image_variants': 1,
+    'image_status': 1,
+    'post_results': 1
+}
+# Every status a post leaves 'Scheduled' for (None matches posts saved before statuses
+# existed). Listed rather than {'$ne': 'Scheduled'} so the (status, scheduled_time, _id)
+# index can merge one ordered scan per status instead of sorting all history in memory.
+HISTORY_STATUSES = ['Publishing', 'Success', 'Partial Success', 'Error', None]
+
+def index():
+    logger.info("Accessing index route")
+    if request.method == 'POST':
+        text = request.form['text']
+        logger.info(f"Received new post request: {text[:50]}...")
+        
+        image_url = None
+        image_variants = None
+        image_status = None
+        image_option = request.form.get('imageOption')
+        image_prompt = request.form.get('imagePrompt')
+        
+        if image_option == 'upload' and 'image' in request.files and request.files['image'].filename != '':
+            image = request.files['image']
+            try:
+                stored = upload_to_digitalocean(image)
+            except UploadRejected as e:
+                logger.warning(f"Rejected image upload: {str(e)}")
+                return jsonify({'error': str(e)}), 400
+            if stored:
+                image_url, image_variants = stored['url'], stored.get('variants')
+            logger.info(f"Image uploaded to DigitalOcean: {image_url}")
+        elif image_option == 'generate' or image_prompt:
+            # Generated in the background so the request doesn't wait on Ideogram
+            image_status = 'pending'
+            logger.info(f"Queued image generation with prompt: {(image_prompt or text)[:50]}...")
+        
+        post_datetime = reserve_next_slot()
+        utc_datetime = post_datetime.astimezone(pytz.UTC)
+        
+        # Accounts this post is published for
+        post_account_ids = request.form.getlist('accounts')
+        
+        post = {
+            'text': text,
+            'rendered': render_post(text),
+            'scheduled_time': utc_datetime,
+            'status': 'Scheduled',
+            'image_url': image_url,
+            'image_prompt': image_prompt,
+            'accounts': post_account_ids
+        }
+        if image_variants:
+            post['image_variants'] = image_variants
+        if image_status:
+            post['image_status'] = image_status
+        result = collection.insert_one(post)
+        logger.info(f"Inserted new post with ID: {result.inserted_id}")
+
+        if image_status:
+            start_pending_image_generation()
+        
+        return redirect(url_for('index'))
+
+    scheduled_content, next_scheduled_cursor = fetch_content_page(
+        {'status': 'Scheduled'}, ASCENDING, request.args.get('scheduled_after'))
+    posted_content, next_history_cursor = fetch_content_page(
+        {'status': {'$in': HISTORY_STATUSES}}, DESCENDING, request.args.get('history_before'))
+
+    # Scheduled content at the top, posted content (most recent first) at the bottom
+    content_list = scheduled_content + posted_content
+    for content in content_list:
+        content['ist_time'] = format_ist_time(content['scheduled_time'])
+        content['status'] = content.get('status', 'Scheduled')
+        content['display_text'] = get_rendered(content)['display_html']
+
+    logger.info(f"Fetched {len(content_list)} posts from database")
+
+    return render_template(
+        'index.html',
+        content_list=content_list,
+        scheduled_after=request.args.get('scheduled_after'),
+        history_before=request.args.get('history_before'),
+        next_scheduled_cursor=next_scheduled_cursor,
+        next_history_cursor=next_history_cursor,
+        accounts=list(get_accounts().values()),
+        account_names=account_names()
+    )
+
+def format_ist_time(scheduled_time):
+    ist = pytz.timezone('Asia/Kolkata')
+    return scheduled_time.replace(tzinfo=pytz.UTC).astimezone(ist).strftime("%Y-%m-%d %I:%M %p IST")
+
+def encode_cursor(content):
+    return f"{content['scheduled_time'].isoformat()}_{content['_id']}"
+
+def decode_cursor(cursor):
+    scheduled_time, content_id = cursor.rsplit('_', 1)
+    return datetime.fromisoformat(scheduled_time), ObjectId(content_id)
+
+# Keyset pagination ordered by (scheduled_time, _id); returns the page and the
+# cursor for the next page, or None when this is the last page
+def fetch_content_page(query, direction, cursor=None, limit=None):
+    limit = limit or DASHBOARD_PAGE_SIZE
+    query = dict(query)
+    if cursor:
+        try:
+            cursor_time, cursor_id = decode_cursor(cursor)
+        except (ValueError, InvalidId):
+            logger.warning(f"Ignoring invalid pagination cursor: {cursor}")
+        else:
+            op = '$gt' if direction == ASCENDING else '$lt'
+            # The inclusive bound on scheduled_time gives the index scan its range; the $or
+            # breaks ties on _id within that range
+            query['scheduled_time'] = {op + 'e': cursor_time}
+            query['$or'] = [
+                {'scheduled_time': {op: cursor_time}},
+                {'scheduled_time': cursor_time, '_id': {op: cursor_id}}
+            ]
+
+    page = list(
+        collection.find(query, DASHBOARD_PROJECTION)
+        .sort([('scheduled_time', direction), ('_id', direction)])
+        .limit(limit + 1)
+    )
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+def thread_preview(content_id=None):
+    # How each post will be split into an X thread; without an id, previews the scheduled queue
+    if content_id:
+        posts = [collection.find_one({'_id': ObjectId(content_id)}, {'text': 1, 'rendered': 1})]
+        if not posts[0]:
+            return jsonify({'error': 'Content not found'}), 404
+    else:
+        posts = collection.find({'status': 'Scheduled'}, {'text': 1, 'rendered': 1}).sort('scheduled_time', ASCENDING)
+
+    previews = []
+    for post in posts:
+        segments = get_rendered(post)['twitter_segments']
+        previews.append({
+            'post_id': str(post['_id']),
+            'tweets': len(segments),
+            'segments': [{'text': segment, 'weighted_length': weighted_length(segment)} for segment in segments]
+        })
+    return jsonify(previews)
+
+def bulk_import():
+    # Accepts a JSONL or CSV upload ('file' field) or a raw JSONL/CSV request body
+    if 'file' in request.files:
+        upload = request.files['file']
+        stream = upload.stream
+        fmt = request.args.get('format') or detect_format(upload.filename, upload.mimetype)
+    else:
+        stream = request.stream
+        fmt = request.args.get('format') or detect_format(content_type=request.content_type)
+    logger.info(f"Received bulk import request ({fmt})")
+
+    summary = import_posts(stream, fmt)
+    if summary['pending_images']:
+        start_pending_image_generation()
+    # An aborted import still reports the rows it imported before stopping
+    return jsonify(summary), 500 if summary.get('aborted') else 200
+
+def delete_content(content_id):
+    logger.info(f"Deleting content with ID: {content_id}")
+    content = collection.find_one_and_delete({'_id': ObjectId(content_id)}, {'scheduled_time': 1})
+    result_count = 1 if content else 0
+    if content:
+        release_slot(content['scheduled_time'])
+    logger.info(f"Delete result: {result_count} document(s) deleted")
+    return redirect(url_for('index'))
+
+def edit_content(content_id):
+    logger.info(f"Accessing edit_content route for content ID: {content_id}")
+    content = collection.find_one({'_id': ObjectId(content_id)})
+    if request.method == 'POST':
+        text = request.form['text']
+        logger.info(f"Updating content: {text[:50]}...")
+        
+        # Store the text as-is, without replacing newlines
+        result = collection.update_one(
+            {'_id': ObjectId(content_id)},
+            {'$set': {'text': text, 'rendered': render_post(text)}}
+        )
+        logger.info(f"Update result: {result.modified_count} document(s) modified")
+        return redirect(url_for('index'))
+    
+    content['ist_time'] = format_ist_time(content['scheduled_time'])
+    return render_template('edit_content.html', content=content)
+
+def find_next_slot():
+    return jsonify({'next_slot': find_next_available_slot().isoformat()})
+
+def change_image(content_id):
+    content = collection.find_one({'_id': ObjectId(content_id)})
+    if request.method == 'POST':
+        if 'image' in request.files:
+            image = request.files['image']
+            if image.filename != '':
+                try:
+                    stored = upload_to_digitalocean(image)
+                except UploadRejected as e:
+                    logger.warning(f"Rejected image upload: {str(e)}")
+                    return jsonify({'error': str(e)}), 400
+                if stored:
+                    collection.update_one(
+                        {'_id': ObjectId(content_id)},
+                        {'$set': {'image_url': stored['url'], 'image_variants': stored.get('variants') or {}}}
+                    )
+                    logger.info(f"Image updated for content ID: {content_id}")
+        return redirect(url_for('index'))
+    return render_template('change_image.html', content=content)
+
+def remove_image(content_id):
+    collection.update_one(
+        {'_id': ObjectId(content_id)},
+        {'$unset': {'image_url': '', 'image_variants': ''}}
+    )
+    logger.info(f"Image removed for content ID: {content_id}")
+    return redirect(url_for('index'))
+
+def regenerate_image(content_id):
+    content = collection.find_one({'_id': ObjectId(content_id)})
+    if not content:
+        return jsonify({'error': 'Content not found'}), 404
+    
+    prompt = request.form.get('prompt', content['text'])
+    logger.info(f"Queued image regeneration for content ID: {content_id} with prompt: {prompt[:50]}...")
+
+    # The current image stays in place until the background job replaces it
+    collection.update_one(
+        {'_id': ObjectId(content_id)},
+        {
+            '$set': {'image_prompt': prompt, 'image_status': 'pending', 'image_regenerate': True},
+            '$unset': {'image_error': ''}
+        }
+    )
+    start_pending_image_generation()
+    return jsonify({'success': True, 'image_status': 'pending'})
+
+def image_status(content_id):
+    try:
+        content_id = ObjectId(content_id)
+    except InvalidId:
+        return jsonify({'error': 'Content not found'}), 404
+    content = collection.find_one(
+        {'_id': content_id},
+        {'image_url': 1, 'image_status': 1, 'image_error': 1}
+    )
+    if not content:
+        return jsonify({'error': 'Content not found'}), 404
+
+    return jsonify({
+        'image_status': content.get('image_status', 'ready' if content.get('image_url') else None),
+        'image_url': content.get('image_url'),
+        'error': content.get('image_error')
+    })
@@ -0,0 +1,22 @@
+import os
+from pymongo import AsyncMongoClient, MongoClient
+from dotenv import load_dotenv
+from metrics import MongoCommandTimer
+
+load_dotenv()
+
+# Shared MongoDB connection used by the app and the posting modules
+MONGO_URI = os.environ.get('MONGO_URI')
+client = MongoClient(MONGO_URI, event_listeners=[MongoCommandTimer()])
+db = client['content_database']
+
+_async_db = None
+
+def get_async_db():
+    # Async client for the async server (async_app.py), created on first use because it is
+    # bound to the event loop it runs on; the server runs one loop per process
+    global _async_db
+    if _async_db is None:
+        async_client = AsyncMongoClient(MONGO_URI, event_listeners=[MongoCommandTimer()])
+        _async_db = async_client['content_database']
+    return _async_db
@@ -0,0 +1,143 @@
+import os
+import json
+import logging
+import threading
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Connection pool and timeout tuning for outbound integrations
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 16))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 60))
+# The async server (async_app.py) shares one connection pool across all in-flight requests
+ASYNC_HTTP_POOL_SIZE = int(os.environ.get('ASYNC_HTTP_POOL_SIZE', 200))
+
+_sessions = {}
+_twitter_clients = {}
+_async_session = None
+_lock = threading.Lock()
+
+def get_session(url):
+    # One keep-alive session per host so repeated calls skip the TCP+TLS handshake
+    host = urlsplit(url).netloc
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[host] = session
+            logger.info(f"Created HTTP session for {host}")
+    return session
+
+def request(method, url, stage='other', **kwargs):
+    # stage names the call (e.g. 'linkedin_share') in the http_request latency histogram
+    kwargs.setdefault('timeout', (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    with span('http_request', stage=stage, host=urlsplit(url).netloc, method=method) as labels:
+        response = get_session(url).request(method, url, **kwargs)
+        labels['code'] = response.status_code
+    return response
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+def put(url, **kwargs):
+    return request('PUT', url, **kwargs)
+
+def get_twitter_clients(credentials):
+    # Build the v2 client and v1.1 API (used for media uploads) once per account. tweepy,
+    # like aiohttp and oauthlib below, is imported on first use to keep cold starts short.
+    import tweepy
+    with _lock:
+        clients = _twitter_clients.get(credentials)
+        if clients is None:
+            api_key, api_secret, access_token, access_token_secret = credentials
+            client = tweepy.Client(
+                consumer_key=api_key,
+                consumer_secret=api_secret,
+                access_token=access_token,
+                access_token_secret=access_token_secret,
+                return_type=requests.Response
+            )
+            auth = tweepy.OAuth1UserHandler(api_key, api_secret, access_token, access_token_secret)
+            api = tweepy.API(auth)
+            clients = (client, api)
+            _twitter_clients[credentials] = clients
+    return clients
+
+def twitter_auth_header(credentials, method, url, form=None):
+    # OAuth 1.0a header for a user-context X call; form-encoded bodies are part of the
+    # signature, JSON and multipart bodies are not
+    from oauthlib.oauth1 import Client as OAuth1Client
+    api_key, api_secret, access_token, access_token_secret = credentials
+    signer = OAuth1Client(api_key, client_secret=api_secret,
+                          resource_owner_key=access_token, resource_owner_secret=access_token_secret)
+    if form:
+        _, headers, _ = signer.sign(url, http_method=method, body=form,
+                                    headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    else:
+        _, headers, _ = signer.sign(url, http_method=method)
+    return headers['Authorization']
+
+class AsyncResponse:
+    # The parts of a requests.Response the posting code reads, for aiohttp responses
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+def get_async_session():
+    global _async_session
+    import aiohttp
+    if _async_session is None or _async_session.closed:
+        _async_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=ASYNC_HTTP_POOL_SIZE),
+            timeout=aiohttp.ClientTimeout(sock_connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT)
+        )
+        logger.info("Created async HTTP session")
+    return _async_session
+
+async def close_async_session():
+    if _async_session is not None and not _async_session.closed:
+        await _async_session.close()
+
+async def async_request(method, url, stage='other', **kwargs):
+    # Same as request() but on the event loop; the body is read before returning
+    with span('http_request', stage=stage, host=urlsplit(url).netloc, method=method) as labels:
+        async with get_async_session().request(method, url, **kwargs) as response:
+            content = await response.read()
+        labels['code'] = response.status
+    return AsyncResponse(response.status, response.headers, content)
+
+@asynccontextmanager
+async def async_stream(method, url, stage='other', **kwargs):
+    # For bodies too large to read at once: yields the aiohttp response to read in chunks
+    with span('http_request', stage=stage, host=urlsplit(url).netloc, method=method) as labels:
+        async with get_async_session().request(method, url, **kwargs) as response:
+            labels['code'] = response.status
+            yield response
+
+async def async_get(url, **kwargs):
+    return await async_request('GET', url, **kwargs)
+
+async def async_post(url, **kwargs):
+    return await async_request('POST', url, **kwargs)
+
+async def async_put(url, **kwargs):
+    return await async_request('PUT', url, **kwargs)
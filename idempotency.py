@@ -0,0 +1,111 @@
+import os
+import logging
+from datetime import datetime
+import pytz
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from database import db, get_async_db
+from rate_limiter import TransientError
+
+logger = logging.getLogger(__name__)
+
+# Ledger of outbound publish calls keyed by an idempotency key such as
+# '<post id>:linkedin:<account>' or '<post id>:twitter:<account>:<tweet index>'.
+# Neither LinkedIn nor X accept idempotency keys, so they are enforced here: a key is
+# recorded before the call goes out, and a second caller with the same key gets the
+# stored result (or an error while the first call is in flight) instead of posting again.
+publish_calls = db['publish_calls']
+
+IDEMPOTENCY_RETENTION_DAYS = int(os.environ.get('IDEMPOTENCY_RETENTION_DAYS', 30))
+
+class DuplicatePublish(Exception):
+    pass
+
+def ensure_indexes():
+    try:
+        publish_calls.create_index('started_at', expireAfterSeconds=IDEMPOTENCY_RETENTION_DAYS * 24 * 60 * 60)
+    except PyMongoError as e:
+        logger.warning(f"Failed to create publish_calls index: {str(e)}")
+
+def call_once(key, send, succeeded=bool):
+    # Run send() at most once per key across every process; returns the result of the
+    # call that went out. Failed calls release the key so they can be retried.
+    if not key:
+        return send()
+
+    try:
+        publish_calls.insert_one({'_id': key, 'state': 'sending', 'started_at': datetime.now(pytz.UTC)})
+    except DuplicateKeyError:
+        existing = publish_calls.find_one({'_id': key}) or {}
+        if existing.get('state') == 'sent':
+            logger.info(f"Skipping duplicate publish call {key}, already sent")
+            return existing['result']
+        # Either in flight elsewhere, or a process died mid-call and the outcome is unknown
+        raise DuplicatePublish(f"Publish call {key} is in flight or its outcome is unknown; check the account before retrying")
+    except PyMongoError as e:
+        # Without the ledger a retry could double post, so defer instead of sending
+        raise TransientError(f"Idempotency ledger unavailable: {str(e)}")
+
+    try:
+        result = send()
+    except Exception:
+        release(key)
+        raise
+
+    if not succeeded(result):
+        release(key)
+        return result
+    try:
+        publish_calls.update_one(
+            {'_id': key},
+            {'$set': {'state': 'sent', 'result': result, 'completed_at': datetime.now(pytz.UTC)}}
+        )
+    except PyMongoError as e:
+        logger.error(f"Failed to record publish call {key}: {str(e)}")
+    return result
+
+async def call_once_async(key, send, succeeded=bool):
+    # call_once() for the async server, where send is a coroutine function
+    if not key:
+        return await send()
+
+    calls = get_async_db()['publish_calls']
+    try:
+        await calls.insert_one({'_id': key, 'state': 'sending', 'started_at': datetime.now(pytz.UTC)})
+    except DuplicateKeyError:
+        existing = await calls.find_one({'_id': key}) or {}
+        if existing.get('state') == 'sent':
+            logger.info(f"Skipping duplicate publish call {key}, already sent")
+            return existing['result']
+        raise DuplicatePublish(f"Publish call {key} is in flight or its outcome is unknown; check the account before retrying")
+    except PyMongoError as e:
+        raise TransientError(f"Idempotency ledger unavailable: {str(e)}")
+
+    try:
+        result = await send()
+    except Exception:
+        await release_async(key)
+        raise
+
+    if not succeeded(result):
+        await release_async(key)
+        return result
+    try:
+        await calls.update_one(
+            {'_id': key},
+            {'$set': {'state': 'sent', 'result': result, 'completed_at': datetime.now(pytz.UTC)}}
+        )
+    except PyMongoError as e:
+        logger.error(f"Failed to record publish call {key}: {str(e)}")
+    return result
+
+def release(key):
+    try:
+        publish_calls.delete_one({'_id': key, 'state': 'sending'})
+    except PyMongoError as e:
+        logger.warning(f"Failed to release publish call {key}: {str(e)}")
+
+async def release_async(key):
+    try:
+        await get_async_db()['publish_calls'].delete_one({'_id': key, 'state': 'sending'})
+    except PyMongoError as e:
+        logger.warning(f"Failed to release publish call {key}: {str(e)}")
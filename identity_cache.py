@@ -0,0 +1,78 @@
+import os
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+import pytz
+from pymongo.errors import PyMongoError
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# LinkedIn person URNs keyed by a hash of the access token (tokens are never stored)
+IDENTITY_CACHE_TTL = int(os.environ.get('LINKEDIN_IDENTITY_CACHE_TTL', 24 * 60 * 60))
+identities = db['linkedin_identities']
+
+_memory_cache = {}
+_lock = threading.Lock()
+
+def ensure_indexes():
+    try:
+        identities.create_index('expires_at', expireAfterSeconds=0)
+    except PyMongoError as e:
+        logger.warning(f"Failed to create linkedin_identities index: {str(e)}")
+
+def token_key(token):
+    return hashlib.sha256((token or '').encode('utf-8')).hexdigest()
+
+def get_cached_person_urn(token):
+    key = token_key(token)
+    now = datetime.now(pytz.UTC)
+
+    with _lock:
+        cached = _memory_cache.get(key)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    # Fall back to the shared cache so restarts and other gunicorn workers reuse lookups
+    try:
+        doc = identities.find_one({'_id': key})
+    except PyMongoError as e:
+        logger.warning(f"Failed to read LinkedIn identity cache: {str(e)}")
+        return None
+    if not doc:
+        return None
+
+    expires_at = doc['expires_at'].replace(tzinfo=pytz.UTC)
+    if expires_at <= now:
+        return None
+
+    with _lock:
+        _memory_cache[key] = (doc['person_urn'], expires_at)
+    return doc['person_urn']
+
+def cache_person_urn(token, person_urn):
+    key = token_key(token)
+    expires_at = datetime.now(pytz.UTC) + timedelta(seconds=IDENTITY_CACHE_TTL)
+
+    with _lock:
+        _memory_cache[key] = (person_urn, expires_at)
+    try:
+        identities.update_one(
+            {'_id': key},
+            {'$set': {'person_urn': person_urn, 'expires_at': expires_at}},
+            upsert=True
+        )
+    except PyMongoError as e:
+        logger.warning(f"Failed to write LinkedIn identity cache: {str(e)}")
+
+def invalidate_person_urn(token):
+    key = token_key(token)
+    logger.info("Invalidating cached LinkedIn person URN")
+
+    with _lock:
+        _memory_cache.pop(key, None)
+    try:
+        identities.delete_one({'_id': key})
+    except PyMongoError as e:
+        logger.warning(f"Failed to invalidate LinkedIn identity cache: {str(e)}")
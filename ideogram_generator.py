@@ -1,44 +1,162 @@
 import requests
 import os
+import asyncio
 import json
 import logging
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+import http_clients
+from metrics import sample_verbose, span
 
 IDEOGRAM_API_KEY = os.environ.get('IDEOGRAM_API_KEY')
 IDEOGRAM_API_URL = 'https://api.ideogram.ai/generate'
 
+# Generated image URLs keyed by normalized prompt + generation parameters.
+# Ideogram URLs are ephemeral, so entries also expire by age.
+IMAGE_CACHE_MAX_ENTRIES = int(os.environ.get('IMAGE_CACHE_MAX_ENTRIES', 256))
+IMAGE_CACHE_TTL = int(os.environ.get('IMAGE_CACHE_TTL', 60 * 60))
+
 logger = logging.getLogger(__name__)
 
-def generate_image(text):
+_cache = OrderedDict()
+_in_flight = {}
+_lock = threading.Lock()
+
+def normalize_prompt(text):
+    return ' '.join((text or '').split())
+
+def cache_key(text, aspect_ratio, model, magic_prompt_option):
+    key = json.dumps([normalize_prompt(text), aspect_ratio, model, magic_prompt_option])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def generate_image(text, aspect_ratio="ASPECT_10_16", model="V_2", magic_prompt_option="AUTO", use_cache=True):
+    # Timed as a whole, labelled by whether the cache answered, a duplicate was awaited or Ideogram was called
+    with span('image_generation', cache='miss' if use_cache else 'bypass') as labels:
+        return get_image(labels, text, aspect_ratio, model, magic_prompt_option, use_cache)
+
+async def generate_image_async(text, aspect_ratio="ASPECT_10_16", model="V_2", magic_prompt_option="AUTO", use_cache=True):
+    # Event-loop version for the async server; shares the cache with generate_image
+    with span('image_generation', cache='miss' if use_cache else 'bypass') as labels:
+        if not use_cache:
+            return await request_image_async(text, aspect_ratio, model, magic_prompt_option)
+
+        key = cache_key(text, aspect_ratio, model, magic_prompt_option)
+        image_url, future, owner = lookup(labels, key, text)
+        if image_url:
+            return image_url
+        if not owner:
+            return await asyncio.wrap_future(future)
+
+        try:
+            image_url = await request_image_async(text, aspect_ratio, model, magic_prompt_option)
+        except Exception as e:
+            finish(key, future, error=e)
+            raise
+        finish(key, future, image_url)
+        return image_url
+
+def get_image(labels, text, aspect_ratio, model, magic_prompt_option, use_cache):
+    if not use_cache:
+        return request_image(text, aspect_ratio, model, magic_prompt_option)
+
+    key = cache_key(text, aspect_ratio, model, magic_prompt_option)
+    image_url, future, owner = lookup(labels, key, text)
+    if image_url:
+        return image_url
+    if not owner:
+        return future.result()
+
+    try:
+        image_url = request_image(text, aspect_ratio, model, magic_prompt_option)
+    except Exception as e:
+        finish(key, future, error=e)
+        raise
+    finish(key, future, image_url)
+    return image_url
+
+def lookup(labels, key, text):
+    # Returns (cached url, None, False), or the future to wait on and whether this caller
+    # owns the upstream call
+    with _lock:
+        cached = _cache.get(key)
+        if cached and time.monotonic() - cached[1] < IMAGE_CACHE_TTL:
+            _cache.move_to_end(key)
+            labels['cache'] = 'hit'
+            logger.info(f"Image cache hit for prompt: {text[:50]}...")
+            return cached[0], None, False
+
+        # Concurrent requests for the same prompt wait on the first caller's upstream call
+        future = _in_flight.get(key)
+        owner = future is None
+        if owner:
+            future = Future()
+            _in_flight[key] = future
+
+    if not owner:
+        labels['cache'] = 'coalesced'
+        logger.info(f"Waiting on in-flight image generation for prompt: {text[:50]}...")
+    return None, future, owner
+
+def finish(key, future, image_url=None, error=None):
+    with _lock:
+        _in_flight.pop(key, None)
+        if error is None:
+            _cache[key] = (image_url, time.monotonic())
+            _cache.move_to_end(key)
+            while len(_cache) > IMAGE_CACHE_MAX_ENTRIES:
+                _cache.popitem(last=False)
+    if error is None:
+        future.set_result(image_url)
+    else:
+        future.set_exception(error)
+
+def image_request(text, aspect_ratio, model, magic_prompt_option):
     headers = {
         'Api-Key': IDEOGRAM_API_KEY,
         'Content-Type': 'application/json'
     }
-    
     data = {
         "image_request": {
             "prompt": text,
-            "aspect_ratio": "ASPECT_10_16",
-            "model": "V_2",
-            "magic_prompt_option": "AUTO"
+            "aspect_ratio": aspect_ratio,
+            "model": model,
+            "magic_prompt_option": magic_prompt_option
         }
     }
+    return headers, data
+
+def image_url_from(response_data):
+    if sample_verbose():
+        logger.info(f"Received response from Ideogram API: {json.dumps(response_data, indent=2)}")
+    if 'data' in response_data and len(response_data['data']) > 0:
+        image_url = response_data['data'][0]['url']
+        logger.info(f"Successfully generated image URL: {image_url}")
+        return image_url
+    logger.error("No image data in the response")
+    raise Exception("No image data in the response")
+
+async def request_image_async(text, aspect_ratio, model, magic_prompt_option):
+    headers, data = image_request(text, aspect_ratio, model, magic_prompt_option)
+    logger.info(f"Sending request to Ideogram API with prompt: {text[:50]}...")
+    response = await http_clients.async_post(IDEOGRAM_API_URL, headers=headers, json=data, stage='ideogram_generate')
+    if response.status_code >= 400:
+        logger.error(f"Request to Ideogram API failed: {response.status_code} {response.text[:200]}")
+        raise Exception(f"Ideogram API returned {response.status_code}")
+    return image_url_from(response.json())
+
+def request_image(text, aspect_ratio, model, magic_prompt_option):
+    headers, data = image_request(text, aspect_ratio, model, magic_prompt_option)
     
     logger.info(f"Sending request to Ideogram API with prompt: {text[:50]}...")
     
     try:
-        response = requests.post(IDEOGRAM_API_URL, headers=headers, json=data)
+        response = http_clients.post(IDEOGRAM_API_URL, headers=headers, json=data, stage='ideogram_generate')
         response.raise_for_status()  # This will raise an HTTPError for bad responses
         
-        response_data = response.json()
-        logger.info(f"Received response from Ideogram API: {json.dumps(response_data, indent=2)}")
-        
-        if 'data' in response_data and len(response_data['data']) > 0:
-            image_url = response_data['data'][0]['url']
-            logger.info(f"Successfully generated image URL: {image_url}")
-            return image_url
-        else:
-            logger.error("No image data in the response")
-            raise Exception("No image data in the response")
+        return image_url_from(response.json())
     except requests.exceptions.RequestException as e:
         logger.error(f"Request to Ideogram API failed: {str(e)}")
         raise
@@ -0,0 +1,109 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import pytz
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Posts with image_status 'pending' get their image generated off the request path
+collection = db['posts']
+
+IMAGE_GENERATION_WORKERS = int(os.environ.get('IMAGE_GENERATION_WORKERS', 2))
+IMAGE_GENERATION_LEASE_SECONDS = int(os.environ.get('IMAGE_GENERATION_LEASE_SECONDS', 300))
+executor = ThreadPoolExecutor(max_workers=IMAGE_GENERATION_WORKERS, thread_name_prefix='image')
+
+def ensure_indexes():
+    try:
+        collection.create_index([('image_status', ASCENDING)], sparse=True)
+    except PyMongoError as e:
+        logger.warning(f"Failed to create image_status index: {str(e)}")
+
+def claim_pending_image(now=None):
+    # Atomically take one pending post; generations stuck past the lease are picked up again
+    now = now or datetime.now(pytz.UTC)
+    return collection.find_one_and_update(
+        {'$or': [
+            {'image_status': 'pending'},
+            {
+                'image_status': 'generating',
+                'image_started_at': {'$lte': now - timedelta(seconds=IMAGE_GENERATION_LEASE_SECONDS)}
+            }
+        ]},
+        {'$set': {'image_status': 'generating', 'image_started_at': now}},
+        sort=[('scheduled_time', ASCENDING)]
+    )
+
+def generate_post_image(post):
+    # Imported here rather than at the top: app.ensure_indexes imports this module on every
+    # cold start (cron included), which shouldn't load PIL, storage and the Ideogram client
+    from ideogram_generator import generate_image
+    prompt = post.get('image_prompt') or post['text']
+    logger.info(f"Generating image for post {post['_id']} with prompt: {prompt[:50]}...")
+    try:
+        # Explicit regeneration must produce a fresh image, so it skips the prompt cache
+        image_url = generate_image(prompt, use_cache=not post.get('image_regenerate'))
+    except Exception as e:
+        logger.error(f"Image generation failed for post {post['_id']}: {str(e)}")
+        collection.update_one(
+            {'_id': post['_id']},
+            {
+                '$set': {'image_status': 'failed', 'image_error': str(e)},
+                '$unset': {'image_regenerate': ''}
+            }
+        )
+        return None
+
+    collection.update_one(
+        {'_id': post['_id']},
+        {
+            '$set': {'image_url': image_url, 'image_status': 'ready'},
+            '$unset': {'image_variants': '', 'image_error': '', 'image_regenerate': ''}
+        }
+    )
+    logger.info(f"Image generated for post {post['_id']}: {image_url}")
+    return mirror_post_image(post['_id'], image_url) or image_url
+
+def mirror_post_image(post_id, image_url):
+    # Ideogram URLs expire, so copy the image to our storage and point the post at the copy
+    from storage import mirror_image
+    try:
+        record = mirror_image(image_url)
+    except Exception as e:
+        logger.error(f"Failed to mirror image for post {post_id}: {str(e)}")
+        return None
+    if record['url'] != image_url:
+        # Only rewrite if nobody replaced the image in the meantime
+        collection.update_one(
+            {'_id': post_id, 'image_url': image_url},
+            {'$set': {'image_url': record['url'], 'image_variants': record.get('variants') or {}}}
+        )
+    return record['url']
+
+def start_image_mirror(post_id, image_url):
+    executor.submit(mirror_post_image, post_id, image_url)
+
+def generate_pending_images():
+    generated = 0
+    while True:
+        post = claim_pending_image()
+        if not post:
+            break
+        if generate_post_image(post):
+            generated += 1
+    return generated
+
+def drain_pending_images():
+    try:
+        generated = generate_pending_images()
+        logger.info(f"Background image generation finished: {generated} image(s) generated")
+    except Exception as e:
+        logger.error(f"Background image generation failed: {str(e)}", exc_info=True)
+
+def start_pending_image_generation():
+    # Drain the pending queue in the background; extra drains exit as soon as it is empty
+    for _ in range(IMAGE_GENERATION_WORKERS):
+        executor.submit(drain_pending_images)
@@ -0,0 +1,261 @@
+import os
+import time
+import uuid
+import random
+import socket
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timedelta
+import pytz
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from database import db, get_async_db
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# The posts collection doubles as the job queue: a due 'Scheduled' post is a pending job
+collection = db['posts']
+
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 300))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_RETRY_BASE_SECONDS = int(os.environ.get('JOB_RETRY_BASE_SECONDS', 60))
+# A lease held by a running publish is pushed forward this often, well inside its length
+JOB_LEASE_RENEW_SECONDS = JOB_LEASE_SECONDS / 3
+
+def worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+def claim_next_post(owner, now=None):
+    # Atomically move one due post from 'Scheduled' to 'Publishing' under a lease.
+    # Posts whose lease expired (crashed worker) are reclaimed the same way.
+    now = now or datetime.now(pytz.UTC)
+    return collection.find_one_and_update(
+        {'$or': [
+            {
+                'status': 'Scheduled',
+                'scheduled_time': {'$lte': now},
+                'next_attempt_at': {'$not': {'$gt': now}}
+            },
+            {
+                'status': 'Publishing',
+                'lease_expires_at': {'$lte': now}
+            }
+        ]},
+        {
+            '$set': {
+                'status': 'Publishing',
+                'lease_owner': owner,
+                'lease_expires_at': now + timedelta(seconds=JOB_LEASE_SECONDS)
+            },
+            '$inc': {'attempts': 1}
+        },
+        sort=[('scheduled_time', 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def claim_post(post_id, owner, now=None):
+    # Claim one specific post for an on-demand publish (Post Now, Retry Failed) under the
+    # same lease the queue uses, so it can't be published by a cron run at the same time.
+    # Counts as an attempt, like a queue claim. Returns the post as it was before the claim
+    # (attempts not yet incremented), or None if someone else holds it.
+    query, update = post_claim(post_id, owner, now)
+    return collection.find_one_and_update(query, update, return_document=ReturnDocument.BEFORE)
+
+async def claim_post_async(post_id, owner, now=None):
+    query, update = post_claim(post_id, owner, now)
+    return await get_async_db()['posts'].find_one_and_update(query, update, return_document=ReturnDocument.BEFORE)
+
+def post_claim(post_id, owner, now=None):
+    now = now or datetime.now(pytz.UTC)
+    query = {'_id': post_id, '$or': [
+        {'status': {'$ne': 'Publishing'}},
+        {'lease_expires_at': {'$lte': now}}
+    ]}
+    update = {
+        '$set': {
+            'status': 'Publishing',
+            'lease_owner': owner,
+            'lease_expires_at': now + timedelta(seconds=JOB_LEASE_SECONDS)
+        },
+        '$inc': {'attempts': 1}
+    }
+    return query, update
+
+def release_post(post_id, owner, status):
+    # Give up a claim without publishing, restoring the post's previous status; a post taken
+    # over from an expired lease goes back to the queue
+    collection.update_one({'_id': post_id, 'lease_owner': owner}, post_release(status))
+
+async def release_post_async(post_id, owner, status):
+    await get_async_db()['posts'].update_one({'_id': post_id, 'lease_owner': owner}, post_release(status))
+
+def post_release(status):
+    if status == 'Publishing':
+        status = 'Scheduled'
+    return {'$set': {'status': status}, '$unset': {'lease_owner': '', 'lease_expires_at': ''}}
+
+def lease_renewal(post_id, owner):
+    query = {'_id': post_id, 'lease_owner': owner}
+    update = {'$set': {'lease_expires_at': datetime.now(pytz.UTC) + timedelta(seconds=JOB_LEASE_SECONDS)}}
+    return query, update
+
+@contextmanager
+def lease_kept(post_id, owner):
+    # Keep renewing the lease while a publish runs. Waiting on X media processing, chunked
+    # uploads or rate limits can take longer than the lease, and an expired lease would let
+    # another worker reclaim a post that is still being published.
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(JOB_LEASE_RENEW_SECONDS):
+            try:
+                if not collection.update_one(*lease_renewal(post_id, owner)).matched_count:
+                    logger.warning(f"Lost the lease on post {post_id}")
+                    return
+            except PyMongoError as e:
+                logger.warning(f"Failed to renew the lease on post {post_id}: {str(e)}")
+
+    thread = threading.Thread(target=renew, name=f"lease-{post_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+
+@asynccontextmanager
+async def lease_kept_async(post_id, owner):
+    async def renew():
+        while True:
+            await asyncio.sleep(JOB_LEASE_RENEW_SECONDS)
+            try:
+                if not (await get_async_db()['posts'].update_one(*lease_renewal(post_id, owner))).matched_count:
+                    logger.warning(f"Lost the lease on post {post_id}")
+                    return
+            except PyMongoError as e:
+                logger.warning(f"Failed to renew the lease on post {post_id}: {str(e)}")
+
+    task = asyncio.create_task(renew())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+def retry_delay(attempts, minimum=0):
+    # Exponential backoff with jitter so throttled posts don't all come back at once
+    delay = max(JOB_RETRY_BASE_SECONDS * (2 ** (attempts - 1)), minimum)
+    return delay * random.uniform(1, 1.5)
+
+def outcome_update(post_id, attempts, post_results, overall_status, delay):
+    # The update that records a publish attempt, and the status to report. Throttled or
+    # transiently failing targets (delay is not None) go back on the queue with a jittered
+    # backoff; the next attempt only publishes to the targets that haven't succeeded yet.
+    if overall_status != 'Success' and delay is not None and attempts < JOB_MAX_ATTEMPTS:
+        next_attempt_at = datetime.now(pytz.UTC) + timedelta(seconds=retry_delay(attempts, delay))
+        logger.info(f"Post {post_id} has retryable failures, will be retried at {next_attempt_at}")
+        return {
+            '$set': {'status': 'Scheduled', 'post_results': post_results, 'next_attempt_at': next_attempt_at},
+            '$unset': {'lease_owner': '', 'lease_expires_at': ''}
+        }, 'Retrying'
+    return {
+        '$set': {'status': overall_status, 'post_results': post_results},
+        '$unset': {'lease_owner': '', 'lease_expires_at': '', 'next_attempt_at': ''}
+    }, overall_status
+
+def process_post(post, owner):
+    # The posting stack is imported here rather than at the top, so a cron run with nothing
+    # due doesn't load it
+    from ideogram_generator import generate_image
+    from publisher import publish, build_post_results, retry_after
+    from image_jobs import start_image_mirror
+    from rendering import get_rendered
+    from accounts import post_accounts
+
+    logger.info(f"Processing post: {post['_id']} (attempt {post.get('attempts', 1)})")
+    try:
+        with span('post_stage', path='scheduled', stage='render'):
+            rendered = get_rendered(post)
+        image_url = post.get('image_url')
+        if image_url:
+            logger.info(f"Using existing image: {image_url}")
+        else:
+            prompt = post.get('image_prompt') or rendered['plain_text']
+            logger.info(f"Generating image for post: {prompt[:50]}...")
+            with span('post_stage', path='scheduled', stage='image'):
+                image_url = generate_image(prompt)
+            logger.info(f"Image generated: {image_url}")
+            collection.update_one(
+                {'_id': post['_id']},
+                {'$set': {'image_url': image_url, 'image_status': 'ready'}, '$unset': {'image_variants': ''}}
+            )
+            start_image_mirror(post['_id'], image_url)
+
+        logger.info("Posting to LinkedIn and Twitter...")
+        previous_results = post.get('post_results')
+        with span('post_stage', path='scheduled', stage='publish'), lease_kept(post['_id'], owner):
+            results = publish(rendered, image_url, post_accounts(post), previous_results, post['_id'])
+        logger.info(f"LinkedIn results: {list(results['linkedin'].values())}")
+        logger.info(f"Twitter results: {list(results['twitter'].values())}")
+
+        # Prepare detailed status information, keeping targets that succeeded earlier
+        post_results, overall_status = build_post_results(results, image_url, previous_results)
+
+        update, overall_status = outcome_update(post['_id'], post.get('attempts', 1), post_results, overall_status,
+                                                retry_after(results))
+
+        # Update the post status, only if we still hold the lease
+        with span('post_stage', path='scheduled', stage='save'):
+            update_result = collection.update_one({'_id': post['_id'], 'lease_owner': owner}, update)
+        logger.info(f"Post status updated. Update result: {update_result.modified_count} document(s) modified")
+
+        return {
+            'post_id': str(post['_id']),
+            'status': overall_status,
+            'linkedin': post_results['linkedin'],
+            'twitter': post_results['twitter']
+        }
+    except Exception as e:
+        logger.error(f"Error processing scheduled post {post['_id']}: {str(e)}", exc_info=True)
+        attempts = post.get('attempts', 1)
+        if attempts < JOB_MAX_ATTEMPTS:
+            # Release the post back to the queue with exponential backoff
+            next_attempt_at = datetime.now(pytz.UTC) + timedelta(seconds=retry_delay(attempts))
+            update = {
+                '$set': {'status': 'Scheduled', 'next_attempt_at': next_attempt_at, 'last_error': str(e)},
+                '$unset': {'lease_owner': '', 'lease_expires_at': ''}
+            }
+            status = 'Retrying'
+            logger.info(f"Post {post['_id']} will be retried at {next_attempt_at}")
+        else:
+            update = {
+                '$set': {'status': 'Error', 'last_error': str(e)},
+                '$unset': {'lease_owner': '', 'lease_expires_at': '', 'next_attempt_at': ''}
+            }
+            status = 'Error'
+        collection.update_one({'_id': post['_id'], 'lease_owner': owner}, update)
+        return {
+            'post_id': str(post['_id']),
+            'status': status,
+            'error': str(e)
+        }
+
+def count_due_posts(now=None):
+    now = now or datetime.now(pytz.UTC)
+    return collection.count_documents({
+        'status': 'Scheduled',
+        'scheduled_time': {'$lte': now},
+        'next_attempt_at': {'$not': {'$gt': now}}
+    })
+
+def run_due_posts(owner=None, deadline=None):
+    # Drain due posts until the queue is empty or the time budget runs out
+    owner = owner or worker_id()
+    results = []
+    while deadline is None or time.monotonic() < deadline:
+        post = claim_next_post(owner)
+        if not post:
+            break
+        results.append(process_post(post, owner))
+    return results
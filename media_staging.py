@@ -0,0 +1,137 @@
+import os
+import hashlib
+import logging
+import tempfile
+import http_clients
+
+logger = logging.getLogger(__name__)
+
+# Staged media is streamed to a temp file in chunks, so memory stays flat for large images
+# and video; uploaders read it back a chunk at a time
+MEDIA_MAX_BYTES = int(os.environ.get('MEDIA_MAX_BYTES', 512 * 1024 * 1024))
+MEDIA_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Leading magic bytes for the image formats LinkedIn and Twitter accept
+IMAGE_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+EXTENSIONS = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'video/mp4': '.mp4',
+    'video/quicktime': '.mov',
+}
+
+def image_content_type(content):
+    # The image type from the leading bytes, or None if it isn't a supported image
+    for signature, content_type in IMAGE_SIGNATURES:
+        if content.startswith(signature):
+            return content_type
+    if content[:4] == b'RIFF' and content[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+def media_content_type(content):
+    # Like image_content_type, but also recognises the video containers the platforms accept
+    if content[4:8] == b'ftyp':
+        return 'video/quicktime' if content[8:10] == b'qt' else 'video/mp4'
+    return image_content_type(content)
+
+def sniff_content_type(content, fallback=None):
+    return media_content_type(content) or fallback or 'image/jpeg'
+
+def is_video(media):
+    return media['content_type'].startswith('video/')
+
+class MediaSpool:
+    # Writes downloaded chunks to a temp file, hashing and size-checking on the way
+    def __init__(self, url, header_type=None):
+        self.url = url
+        self.header_type = header_type
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.head = b''
+        self.file = tempfile.NamedTemporaryFile(prefix='media-', delete=False)
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > MEDIA_MAX_BYTES:
+            self.discard()
+            raise Exception(f"Media is larger than {MEDIA_MAX_BYTES // (1024 * 1024)} MB")
+        if len(self.head) < 16:
+            self.head += chunk[:16 - len(self.head)]
+        self.digest.update(chunk)
+        self.file.write(chunk)
+
+    def discard(self):
+        self.file.close()
+        release_media({'path': self.file.name})
+
+    def finish(self):
+        self.file.close()
+        content_type = sniff_content_type(self.head, self.header_type)
+        logger.info(f"Staged media ({content_type}, {self.size} bytes) from {self.url}")
+        return {
+            'url': self.url,
+            'path': self.file.name,
+            'size': self.size,
+            'sha256': self.digest.hexdigest(),
+            'content_type': content_type,
+            'filename': f"media{EXTENSIONS.get(content_type, '.jpg')}"
+        }
+
+def header_content_type(headers):
+    return headers.get('Content-Type', '').split(';')[0].strip() or None
+
+def stage_image(image_url):
+    # Download the media once per publish so every platform upload can share the same file;
+    # release_media() removes it when the publish is done
+    if not image_url:
+        return None
+
+    with http_clients.get(image_url, stream=True, stage='image_stage') as response:
+        if response.status_code != 200:
+            raise Exception(f"Failed to download image from URL. Status code: {response.status_code}")
+        spool = MediaSpool(image_url, header_content_type(response.headers))
+        try:
+            for chunk in response.iter_content(MEDIA_DOWNLOAD_CHUNK_SIZE):
+                spool.write(chunk)
+        except Exception:
+            spool.discard()
+            raise
+    return spool.finish()
+
+async def stage_image_async(image_url):
+    if not image_url:
+        return None
+
+    async with http_clients.async_stream('GET', image_url, stage='image_stage') as response:
+        if response.status != 200:
+            raise Exception(f"Failed to download image from URL. Status code: {response.status}")
+        spool = MediaSpool(image_url, header_content_type(response.headers))
+        try:
+            async for chunk in response.content.iter_chunked(MEDIA_DOWNLOAD_CHUNK_SIZE):
+                spool.write(chunk)
+        except Exception:
+            spool.discard()
+            raise
+    return spool.finish()
+
+def read_chunk(media, offset, size):
+    with open(media['path'], 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+def release_media(media):
+    if not media:
+        return
+    try:
+        os.unlink(media['path'])
+    except FileNotFoundError:
+        pass
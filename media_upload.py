@@ -0,0 +1,102 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+import pytz
+from pymongo.errors import PyMongoError
+from database import db
+from rate_limiter import TransientError, RateLimited, bucket_id
+
+logger = logging.getLogger(__name__)
+
+# Progress of chunked media uploads (X INIT/APPEND/FINALIZE, LinkedIn multipart), one
+# document per (platform, account, media file). Saved after every chunk, so an upload that
+# fails part way resumes at the next chunk on the following attempt instead of starting over.
+media_uploads = db['media_uploads']
+
+# Chunks are read from the staged file one at a time; X accepts up to 5 MB per APPEND
+MEDIA_CHUNK_SIZE = int(os.environ.get('MEDIA_CHUNK_SIZE', 4 * 1024 * 1024))
+MEDIA_CHUNK_RETRIES = int(os.environ.get('MEDIA_CHUNK_RETRIES', 3))
+# Above these sizes uploads switch from a single request to the chunked flows
+TWITTER_CHUNKED_THRESHOLD = int(os.environ.get('TWITTER_CHUNKED_THRESHOLD', 5 * 1024 * 1024))
+LINKEDIN_MULTIPART_THRESHOLD = int(os.environ.get('LINKEDIN_MULTIPART_THRESHOLD', 200 * 1024 * 1024))
+# Default lifetime of an unfinished upload session when the platform doesn't say
+UPLOAD_SESSION_TTL = timedelta(hours=23)
+
+def retryable_errors():
+    # requests, aiohttp and tweepy are imported here rather than at the top: app.ensure_indexes
+    # imports this module on every cold start, including routes that never upload anything
+    import requests
+    import aiohttp
+    import tweepy
+    return (TransientError, requests.RequestException, aiohttp.ClientError, asyncio.TimeoutError,
+            tweepy.TwitterServerError)
+
+def ensure_indexes():
+    try:
+        media_uploads.create_index('expires_at', expireAfterSeconds=0)
+    except PyMongoError as e:
+        logger.warning(f"Failed to create media_uploads index: {str(e)}")
+
+def upload_key(platform, credential, media):
+    return f"{bucket_id(platform, credential)}:{media['sha256']}"
+
+def load_progress(key):
+    # The saved state of an unfinished upload of this file, or None to start a new one
+    try:
+        progress = media_uploads.find_one({'_id': key})
+    except PyMongoError as e:
+        logger.warning(f"Failed to read media upload progress: {str(e)}")
+        return None
+    if not progress or progress['expires_at'].replace(tzinfo=pytz.UTC) <= datetime.now(pytz.UTC):
+        return None
+    logger.info(f"Resuming media upload {key}")
+    return progress
+
+def save_progress(key, progress, expires_at=None):
+    if expires_at:
+        progress['expires_at'] = expires_at
+    progress.setdefault('expires_at', datetime.now(pytz.UTC) + UPLOAD_SESSION_TTL)
+    try:
+        media_uploads.replace_one({'_id': key}, progress, upsert=True)
+    except PyMongoError as e:
+        # Without saved progress a later attempt restarts the upload, which is only slower
+        logger.warning(f"Failed to save media upload progress: {str(e)}")
+    return progress
+
+def clear_progress(key):
+    try:
+        media_uploads.delete_one({'_id': key})
+    except PyMongoError as e:
+        logger.warning(f"Failed to clear media upload progress: {str(e)}")
+
+def chunk_ranges(size, chunk_size=MEDIA_CHUNK_SIZE):
+    # (index, offset, length) of each chunk of a file
+    return [(index, offset, min(chunk_size, size - offset))
+            for index, offset in enumerate(range(0, size, chunk_size))]
+
+def with_retries(send, *args):
+    # Retry one chunk on transient failures; throttling is left to the caller to reschedule
+    for attempt in range(MEDIA_CHUNK_RETRIES):
+        try:
+            return send(*args)
+        except RateLimited:
+            raise
+        except retryable_errors() as e:
+            if attempt == MEDIA_CHUNK_RETRIES - 1:
+                raise
+            logger.warning(f"Media chunk upload failed, retrying: {str(e)}")
+            time.sleep(2 ** attempt)
+
+async def with_retries_async(send, *args):
+    for attempt in range(MEDIA_CHUNK_RETRIES):
+        try:
+            return await send(*args)
+        except RateLimited:
+            raise
+        except retryable_errors() as e:
+            if attempt == MEDIA_CHUNK_RETRIES - 1:
+                raise
+            logger.warning(f"Media chunk upload failed, retrying: {str(e)}")
+            await asyncio.sleep(2 ** attempt)
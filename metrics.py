@@ -0,0 +1,103 @@
+import os
+import time
+import bisect
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# In-process latency histograms, exposed in the Prometheus text format on /metrics.
+# Each gunicorn worker keeps its own series; Prometheus sums them across scrape targets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Fraction of calls whose full request/response payloads are logged; 1 logs every call,
+# lower values keep the verbose logging but only for a sample
+VERBOSE_LOG_SAMPLE_RATE = float(os.environ.get('VERBOSE_LOG_SAMPLE_RATE', 1))
+
+_histograms = {}
+_lock = threading.Lock()
+
+class Histogram:
+    def __init__(self, name):
+        self.name = name
+        self.series = {}
+
+    def observe(self, seconds, labels):
+        key = tuple(sorted((name, str(value)) for name, value in labels.items()))
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with _lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {'buckets': [0] * (len(BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+            series['buckets'][index] += 1
+            series['sum'] += seconds
+            series['count'] += 1
+
+def observe(name, seconds, **labels):
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _lock:
+            histogram = _histograms.setdefault(name, Histogram(name))
+    histogram.observe(seconds, labels)
+
+@contextmanager
+def span(name, **labels):
+    # Time a stage; the yielded labels can be filled in (e.g. a status) before it ends
+    labels.setdefault('status', 'ok')
+    start = time.perf_counter()
+    try:
+        yield labels
+    except Exception:
+        labels['status'] = 'error'
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        observe(name, seconds, **labels)
+        if logger.isEnabledFor(logging.DEBUG):
+            fields = ' '.join(f"{key}={value}" for key, value in sorted(labels.items()))
+            logger.debug(f"span={name} duration_ms={seconds * 1000:.1f} {fields}")
+
+def sample_verbose():
+    return VERBOSE_LOG_SAMPLE_RATE >= 1 or random.random() < VERBOSE_LOG_SAMPLE_RATE
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+def render():
+    lines = []
+    with _lock:
+        histograms = [(name, {key: dict(series, buckets=list(series['buckets']))
+                              for key, series in histogram.series.items()})
+                      for name, histogram in sorted(_histograms.items())]
+    for name, series_by_key in histograms:
+        metric = f"{name}_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for key, series in sorted(series_by_key.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, series['buckets']):
+                cumulative += count
+                lines.append(f"{metric}_bucket{format_labels(key, [('le', str(bound))])} {cumulative}")
+            lines.append(f"{metric}_bucket{format_labels(key, [('le', '+Inf')])} {series['count']}")
+            lines.append(f"{metric}_sum{format_labels(key)} {series['sum']}")
+            lines.append(f"{metric}_count{format_labels(key)} {series['count']}")
+    return '\n'.join(lines) + '\n'
+
+class MongoCommandTimer(monitoring.CommandListener):
+    # Times every MongoDB command the shared client sends
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        observe('mongo_command', event.duration_micros / 1e6, command=event.command_name, status='ok')
+
+    def failed(self, event):
+        observe('mongo_command', event.duration_micros / 1e6, command=event.command_name, status='error')
@@ -0,0 +1,131 @@
+from flask import jsonify, request
+from bson import ObjectId
+from ideogram_generator import generate_image
+from publisher import publish, build_post_results, failed_targets, retry_after
+from job_queue import claim_post, lease_kept, outcome_update, release_post, worker_id
+from database import db
+from image_jobs import start_image_mirror
+from rendering import get_rendered
+from accounts import post_accounts
+from metrics import span
+import logging
+
+logger = logging.getLogger(__name__)
+
+# On-demand publishing routes (Post Now, Retry Failed); loaded on the first request to one of them
+collection = db['posts']
+
+def publish_content(content, owner, rendered, image_url, accounts):
+    # Publish to the accounts' targets that haven't succeeded yet and record the outcome
+    previous_results = content.get('post_results')
+    with span('post_stage', path='on_demand', stage='publish'), lease_kept(content['_id'], owner):
+        results = publish(rendered, image_url, accounts, previous_results, content['_id'])
+    linkedin_results = list(results['linkedin'].values())
+    twitter_results = list(results['twitter'].values())
+
+    logger.info(f"LinkedIn post results: {linkedin_results}")
+    logger.info(f"Twitter post results: {twitter_results}")
+
+    # Prepare detailed status information, keeping targets that succeeded earlier; targets
+    # that failed transiently are requeued like a scheduled attempt rather than left failed
+    post_results, overall_status = build_post_results(results, image_url, previous_results)
+    update, overall_status = outcome_update(content['_id'], content.get('attempts', 0) + 1, post_results,
+                                            overall_status, retry_after(results))
+
+    # Update the post status, only if we still hold the claim
+    with span('post_stage', path='on_demand', stage='save'):
+        update_result = collection.update_one({'_id': content['_id'], 'lease_owner': owner}, update)
+    logger.info(f"Post status updated. Update result: {update_result.modified_count} document(s) modified")
+
+    return {
+        'status': overall_status,
+        'linkedin_results': linkedin_results,
+        'twitter_results': twitter_results,
+        'image_url': image_url
+    }
+
+def claim_content(content_id, owner):
+    # Claim the post so a concurrent click or cron run can't publish it at the same time
+    content = claim_post(ObjectId(content_id), owner)
+    if content:
+        return content, None
+    if collection.count_documents({'_id': ObjectId(content_id)}, limit=1):
+        logger.info(f"Content {content_id} is already being published")
+        return None, (jsonify({'error': 'Post is already being published'}), 409)
+    logger.error(f"Content not found for ID: {content_id}")
+    return None, (jsonify({'error': 'Content not found'}), 404)
+
+def generate_and_post():
+    content_id = request.form['content_id']
+    logger.info(f"Received generate_and_post request for content ID: {content_id}")
+    
+    owner = worker_id()
+    with span('post_stage', path='on_demand', stage='claim'):
+        content, error = claim_content(content_id, owner)
+    if error:
+        return error
+    
+    try:
+        # Plain text rendered from the original markdown, preserving formatting
+        with span('post_stage', path='on_demand', stage='render'):
+            rendered = get_rendered(content)
+        
+        image_url = content.get('image_url')
+        
+        if not image_url:
+            prompt = content.get('image_prompt') or rendered['plain_text']
+            logger.info(f"Generating image for content: {prompt[:50]}...")
+            with span('post_stage', path='on_demand', stage='image'):
+                image_url = generate_image(prompt)
+            logger.info(f"Image generated successfully: {image_url}")
+            
+            # Update the content with the generated image URL
+            collection.update_one(
+                {'_id': ObjectId(content_id)},
+                {'$set': {'image_url': image_url}, '$unset': {'image_variants': ''}}
+            )
+            start_image_mirror(ObjectId(content_id), image_url)
+        else:
+            logger.info(f"Using existing image: {image_url}")
+
+        accounts = post_accounts(content)
+        logger.info(f"Posting to LinkedIn and Twitter for accounts: {accounts}")
+        return jsonify(publish_content(content, owner, rendered, image_url, accounts))
+    except Exception as e:
+        logger.error(f"Error in generate_and_post: {str(e)}", exc_info=True)
+        release_post(content['_id'], owner, content.get('status', 'Scheduled'))
+        return jsonify({'error': str(e)}), 500
+
+def retry_failed(content_id):
+    # Resume a partially published post: only the failed (platform, account) targets are
+    # retried, with the image that went out to the others and any media already uploaded
+    logger.info(f"Received retry_failed request for content ID: {content_id}")
+    # Check before claiming, so a click with nothing to retry doesn't use up an attempt
+    content = collection.find_one({'_id': ObjectId(content_id)}, {'post_results': 1})
+    if not content:
+        logger.error(f"Content not found for ID: {content_id}")
+        return jsonify({'error': 'Content not found'}), 404
+    if not failed_targets(content.get('post_results')):
+        return jsonify({'error': 'No failed targets to retry'}), 400
+
+    owner = worker_id()
+    content, error = claim_content(content_id, owner)
+    if error:
+        return error
+
+    post_results = content.get('post_results') or {}
+    targets = failed_targets(post_results)
+    if not targets:
+        release_post(content['_id'], owner, content.get('status', 'Scheduled'))
+        return jsonify({'error': 'No failed targets to retry'}), 400
+
+    try:
+        rendered = get_rendered(content)
+        image_url = post_results.get('image_url') or content.get('image_url')
+        accounts = sorted({account for _, account in targets})
+        logger.info(f"Retrying failed targets: {targets}")
+        return jsonify(publish_content(content, owner, rendered, image_url, accounts))
+    except Exception as e:
+        logger.error(f"Error in retry_failed: {str(e)}", exc_info=True)
+        release_post(content['_id'], owner, content.get('status', 'Scheduled'))
+        return jsonify({'error': str(e)}), 500
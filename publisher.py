@@ -0,0 +1,258 @@
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta
+import pytz
+from concurrent.futures import ThreadPoolExecutor
+from media_staging import release_media, stage_image, stage_image_async
+from accounts import get_accounts
+from metrics import span
+from social_media_poster import (post_to_linkedin_account, post_to_linkedin_account_async,
+                                 post_to_twitter_account, post_to_twitter_account_async)
+
+logger = logging.getLogger(__name__)
+
+# Bounded pool shared by every publish so concurrent requests can't open unlimited connections
+PUBLISH_MAX_WORKERS = int(os.environ.get('PUBLISH_MAX_WORKERS', 8))
+executor = ThreadPoolExecutor(max_workers=PUBLISH_MAX_WORKERS, thread_name_prefix='publish')
+
+# X media ids can be attached for 24 hours after upload; leave a margin before re-uploading
+TWITTER_MEDIA_MAX_AGE = timedelta(hours=23)
+
+def publish(rendered, image_url, accounts=None, previous_results=None, post_id=None):
+    # Fan out one task per (platform, account) target; latency is the slowest target, not the sum.
+    # Targets that already succeeded in an earlier attempt (previous_results) are skipped, and
+    # media those attempts uploaded is reused instead of downloading and uploading it again.
+    # With a post_id every outbound post carries an idempotency key, so concurrent or
+    # repeated publishes of the same post can't post twice.
+    plan = plan_targets(accounts, previous_results, image_url)
+    try:
+        with span('publish_stage', stage='stage_image'):
+            media = stage_image(image_url) if plan['needs_media'] else None
+    except Exception as e:
+        return staging_failed(plan, image_url, e)
+
+    try:
+        return run_targets(plan, rendered, media, post_id)
+    finally:
+        # The staged file is only needed until every upload is done
+        release_media(media)
+
+def run_targets(plan, rendered, media, post_id):
+    registry = plan['registry']
+    futures = {'linkedin': {}, 'twitter': {}}
+    for account in plan['linkedin']:
+        futures['linkedin'][account] = executor.submit(
+            run_for_account, 'linkedin', registry[account], post_to_linkedin_account,
+            rendered['linkedin_text'], media, registry[account].linkedin_token, plan['linkedin_assets'][account],
+            idempotency_key(post_id, 'linkedin', account))
+    for account in plan['twitter']:
+        futures['twitter'][account] = executor.submit(
+            run_for_account, 'twitter', registry[account], post_to_twitter_account,
+            rendered['twitter_segments'], media, registry[account].twitter_credentials,
+            plan['twitter_threads'].get(f"account_{account}"), plan['twitter_media'][account],
+            idempotency_key(post_id, 'twitter', account))
+
+    results = {'linkedin': {}, 'twitter': {}}
+    for platform, platform_futures in futures.items():
+        for account, future in platform_futures.items():
+            try:
+                results[platform][account] = future.result()
+            except Exception as e:
+                logger.error(f"Error posting to {platform} (account {account}): {str(e)}", exc_info=True)
+                results[platform][account] = {'error': str(e)}
+
+    return results
+
+async def publish_async(rendered, image_url, accounts=None, previous_results=None, post_id=None):
+    # publish() for the async server: the targets run as coroutines on the event loop
+    plan = plan_targets(accounts, previous_results, image_url)
+    try:
+        with span('publish_stage', stage='stage_image'):
+            media = await stage_image_async(image_url) if plan['needs_media'] else None
+    except Exception as e:
+        return staging_failed(plan, image_url, e)
+
+    try:
+        return await run_targets_async(plan, rendered, media, post_id)
+    finally:
+        release_media(media)
+
+async def run_targets_async(plan, rendered, media, post_id):
+    registry = plan['registry']
+    targets = [('linkedin', account, run_for_account_async(
+                    'linkedin', registry[account], post_to_linkedin_account_async,
+                    rendered['linkedin_text'], media, registry[account].linkedin_token, plan['linkedin_assets'][account],
+                    idempotency_key(post_id, 'linkedin', account)))
+               for account in plan['linkedin']]
+    targets += [('twitter', account, run_for_account_async(
+                     'twitter', registry[account], post_to_twitter_account_async,
+                     rendered['twitter_segments'], media, registry[account].twitter_credentials,
+                     plan['twitter_threads'].get(f"account_{account}"), plan['twitter_media'][account],
+                     idempotency_key(post_id, 'twitter', account)))
+                for account in plan['twitter']]
+    outcomes = await asyncio.gather(*(coroutine for _, _, coroutine in targets), return_exceptions=True)
+
+    results = {'linkedin': {}, 'twitter': {}}
+    for (platform, account, _), outcome in zip(targets, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"Error posting to {platform} (account {account}): {str(outcome)}", exc_info=outcome)
+            outcome = {'error': str(outcome)}
+        results[platform][account] = outcome
+    return results
+
+def plan_targets(accounts, previous_results, image_url):
+    # Which (platform, account) targets still need posting, and the media they can reuse
+    registry = get_accounts()
+    accounts = list(registry) if accounts is None else [str(account) for account in accounts]
+    unknown = [account for account in accounts if account not in registry]
+    if unknown:
+        logger.warning(f"Skipping unknown or disabled accounts: {unknown}")
+    previous_results = previous_results or {}
+    twitter_threads = previous_results.get('twitter_threads') or {}
+    linkedin_accounts = [account for account in accounts if account in registry and registry[account].linkedin_token
+                         and not succeeded(previous_results, 'linkedin', account)]
+    twitter_accounts = [account for account in accounts if account in registry and registry[account].twitter_credentials
+                        and not succeeded(previous_results, 'twitter', account)]
+
+    # Uploaded media only stands in for this image if the post's image hasn't changed since
+    same_image = previous_results.get('image_url') == image_url
+    linkedin_assets = {account: target_state(previous_results, 'linkedin', account).get('asset_urn') if same_image else None
+                       for account in linkedin_accounts}
+    twitter_media = {account: reusable_media_id(previous_results, account) if same_image else None
+                     for account in twitter_accounts}
+
+    needs_media = any(not asset_urn for asset_urn in linkedin_assets.values()) or \
+        any(not media_id and not twitter_threads.get(f"account_{account}") for account, media_id in twitter_media.items())
+    return {
+        'registry': registry,
+        'linkedin': linkedin_accounts,
+        'twitter': twitter_accounts,
+        'linkedin_assets': linkedin_assets,
+        'twitter_media': twitter_media,
+        'twitter_threads': twitter_threads,
+        'needs_media': needs_media
+    }
+
+def staging_failed(plan, image_url, e):
+    logger.error(f"Failed to stage image {image_url}: {str(e)}")
+    error = {'error': f'Failed to download image: {str(e)}'}
+    return {
+        'linkedin': {account: error for account in plan['linkedin']},
+        'twitter': {account: error for account in plan['twitter']}
+    }
+
+def idempotency_key(post_id, platform, account):
+    return f"{post_id}:{platform}:{account}" if post_id else None
+
+def run_for_account(platform, account, fn, *args):
+    # Respect the account's own concurrency limit across every publish in this process
+    with account.semaphore, span('publish_target', platform=platform, account=account.id) as labels:
+        result = fn(*args)
+        if result.get('error'):
+            labels['status'] = 'retryable' if result.get('retryable') else 'failed'
+        return result
+
+async def run_for_account_async(platform, account, fn, *args):
+    async with account.async_semaphore:
+        with span('publish_target', platform=platform, account=account.id) as labels:
+            result = await fn(*args)
+            if result.get('error'):
+                labels['status'] = 'retryable' if result.get('retryable') else 'failed'
+            return result
+
+def succeeded(previous_results, platform, account):
+    return (previous_results.get(platform) or {}).get(f"account_{account}") == 'Success'
+
+def target_state(previous_results, platform, account):
+    return ((previous_results.get('targets') or {}).get(platform) or {}).get(f"account_{account}") or {}
+
+def reusable_media_id(previous_results, account):
+    state = target_state(previous_results, 'twitter', account)
+    uploaded_at = state.get('media_uploaded_at')
+    if not state.get('media_id') or not uploaded_at:
+        return None
+    if datetime.now(pytz.UTC) - uploaded_at.replace(tzinfo=pytz.UTC) > TWITTER_MEDIA_MAX_AGE:
+        return None
+    return state['media_id']
+
+def build_post_results(results, image_url, previous_results=None):
+    # Merge this attempt into the post_results status maps and per-target state, and work
+    # out the overall status. Targets this attempt didn't run keep their earlier status,
+    # failures included, so they still count against the overall status and can be retried.
+    previous_results = previous_results or {}
+    previous_targets = previous_results.get('targets') or {}
+    now = datetime.now(pytz.UTC)
+    post_results = {
+        'linkedin': dict(previous_results.get('linkedin') or {}),
+        'twitter': dict(previous_results.get('twitter') or {}),
+        'twitter_threads': dict(previous_results.get('twitter_threads') or {}),
+        'targets': {
+            'linkedin': dict(previous_targets.get('linkedin') or {}),
+            'twitter': dict(previous_targets.get('twitter') or {})
+        },
+        'image_url': image_url
+    }
+    for account, result in results['linkedin'].items():
+        key = f"account_{account}"
+        status = "Success" if result.get('id') else "Error"
+        post_results['linkedin'][key] = status
+        post_results['targets']['linkedin'][key] = {
+            'status': status,
+            'attempts': target_state(previous_results, 'linkedin', account).get('attempts', 0) + 1,
+            'post_id': result.get('id'),
+            'asset_urn': result.get('asset_urn'),
+            'error': result.get('error'),
+            'updated_at': now
+        }
+    for account, result in results['twitter'].items():
+        key = f"account_{account}"
+        status = "Success" if result.get('tweet_id') else "Error"
+        previous_state = target_state(previous_results, 'twitter', account)
+        # A reused media id keeps its original upload time
+        media_uploaded_at = None
+        if result.get('media_id'):
+            media_uploaded_at = previous_state.get('media_uploaded_at') \
+                if result['media_id'] == previous_state.get('media_id') else now
+        post_results['twitter'][key] = status
+        post_results['targets']['twitter'][key] = {
+            'status': status,
+            'attempts': previous_state.get('attempts', 0) + 1,
+            'tweet_id': result.get('tweet_id'),
+            'media_id': result.get('media_id'),
+            'media_uploaded_at': media_uploaded_at,
+            'error': result.get('error'),
+            'updated_at': now
+        }
+        # Tweet ids posted so far, so an interrupted thread can resume where it stopped
+        if result.get('tweet_ids'):
+            post_results['twitter_threads'][key] = result['tweet_ids']
+
+    all_statuses = list(post_results['linkedin'].values()) + list(post_results['twitter'].values())
+    overall_status = 'Partial Success' if any(status == 'Success' for status in all_statuses) else 'Error'
+    if all_statuses and all(status == 'Success' for status in all_statuses):
+        overall_status = 'Success'
+
+    return post_results, overall_status
+
+def failed_targets(post_results):
+    # (platform, account) pairs of a previous publish that did not succeed and that
+    # plan_targets would post again; removed or disconnected accounts can't be retried
+    registry = get_accounts()
+    credential = {'linkedin': 'linkedin_token', 'twitter': 'twitter_credentials'}
+    targets = []
+    for platform in ('linkedin', 'twitter'):
+        for key, status in ((post_results or {}).get(platform) or {}).items():
+            account = key[len('account_'):]
+            if status != 'Success' and account in registry and getattr(registry[account], credential[platform]):
+                targets.append((platform, account))
+    return targets
+
+def retry_after(results):
+    # Longest delay requested by a throttled or transiently failing target, or None if
+    # every failure is permanent
+    delays = [result.get('retry_after') or 0
+              for platform_results in results.values()
+              for result in platform_results.values()
+              if result.get('retryable')]
+    return max(delays) if delays else None
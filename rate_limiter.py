@@ -0,0 +1,164 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from email.utils import parsedate_to_datetime
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Token buckets per (platform, account), stored in MongoDB so every gunicorn worker,
+# the publish worker and cron runs draw from the same budget
+buckets = db['rate_limits']
+
+RATE_LIMITS = {
+    'linkedin': {
+        'capacity': float(os.environ.get('RATE_LIMIT_LINKEDIN_CAPACITY', 10)),
+        'refill_seconds': float(os.environ.get('RATE_LIMIT_LINKEDIN_REFILL_SECONDS', 10))
+    },
+    'twitter': {
+        'capacity': float(os.environ.get('RATE_LIMIT_TWITTER_CAPACITY', 5)),
+        'refill_seconds': float(os.environ.get('RATE_LIMIT_TWITTER_REFILL_SECONDS', 60))
+    }
+}
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.environ.get('RATE_LIMIT_MAX_WAIT_SECONDS', 10))
+DEFAULT_RETRY_AFTER_SECONDS = 60
+
+class TransientError(Exception):
+    # A failure worth retrying later (throttling, upstream 5xx)
+    def __init__(self, message, retry_after=DEFAULT_RETRY_AFTER_SECONDS):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RateLimited(TransientError):
+    def __init__(self, platform, retry_after):
+        super().__init__(f"{platform} rate limit reached, retry in {retry_after:.0f}s", retry_after)
+        self.platform = platform
+
+def bucket_id(platform, credential):
+    # Accounts are identified by a hash of their credential so tokens never reach the database
+    return f"{platform}:{hashlib.sha256((credential or '').encode('utf-8')).hexdigest()[:16]}"
+
+def try_acquire(platform, credential, now=None):
+    # Take one token; returns 0 on success, otherwise the seconds until a token is available
+    limits = RATE_LIMITS[platform]
+    key = bucket_id(platform, credential)
+    for _ in range(5):
+        now = now or time.time()
+        bucket = buckets.find_one({'_id': key})
+        if not bucket:
+            try:
+                buckets.insert_one({'_id': key, 'tokens': limits['capacity'] - 1, 'updated_at': now})
+                return 0
+            except DuplicateKeyError:
+                now = None
+                continue
+
+        blocked_until = bucket.get('blocked_until') or 0
+        if blocked_until > now:
+            return blocked_until - now
+
+        updated_at = bucket.get('updated_at', now)
+        tokens = min(limits['capacity'], bucket.get('tokens', limits['capacity']) + (now - updated_at) / limits['refill_seconds'])
+        if tokens < 1:
+            return (1 - tokens) * limits['refill_seconds']
+
+        # Compare-and-swap so concurrent workers can't spend the same token
+        result = buckets.update_one(
+            {'_id': key, 'updated_at': bucket.get('updated_at'), 'tokens': bucket.get('tokens')},
+            {'$set': {'tokens': tokens - 1, 'updated_at': now}}
+        )
+        if result.modified_count:
+            return 0
+        now = None
+    return limits['refill_seconds']
+
+def acquire(platform, credential, max_wait=RATE_LIMIT_MAX_WAIT_SECONDS):
+    # Wait briefly for a token; longer waits are handed back to the caller to reschedule
+    deadline = time.monotonic() + max_wait
+    while True:
+        try:
+            wait = try_acquire(platform, credential)
+        except PyMongoError as e:
+            logger.warning(f"Rate limiter unavailable, proceeding without it: {str(e)}")
+            return
+        if wait <= 0:
+            return
+        if time.monotonic() + wait > deadline:
+            raise RateLimited(platform, wait)
+        time.sleep(wait)
+
+async def acquire_async(platform, credential, max_wait=RATE_LIMIT_MAX_WAIT_SECONDS):
+    # acquire() for the async server: the bucket update runs on a thread, the wait on the loop
+    deadline = time.monotonic() + max_wait
+    while True:
+        try:
+            wait = await asyncio.to_thread(try_acquire, platform, credential)
+        except PyMongoError as e:
+            logger.warning(f"Rate limiter unavailable, proceeding without it: {str(e)}")
+            return
+        if wait <= 0:
+            return
+        if time.monotonic() + wait > deadline:
+            raise RateLimited(platform, wait)
+        await asyncio.sleep(wait)
+
+def parse_retry_after(headers, now=None):
+    now = now or time.time()
+    reset = headers.get('x-rate-limit-reset') or headers.get('x-user-limit-24hour-reset')
+    if reset:
+        try:
+            return max(float(reset) - now, 0)
+        except ValueError:
+            pass
+    retry_after = headers.get('Retry-After')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(retry_after).timestamp() - now, 0)
+            except (TypeError, ValueError):
+                pass
+    return DEFAULT_RETRY_AFTER_SECONDS
+
+def block(platform, credential, seconds):
+    try:
+        buckets.update_one(
+            {'_id': bucket_id(platform, credential)},
+            {'$max': {'blocked_until': time.time() + seconds}},
+            upsert=True
+        )
+    except PyMongoError as e:
+        logger.warning(f"Failed to record rate limit block: {str(e)}")
+
+def record_response(platform, credential, status_code, headers):
+    # Honour the platform's own view of the budget; returns the retry delay when throttled
+    headers = headers or {}
+    if status_code == 429:
+        retry_after = parse_retry_after(headers)
+        logger.warning(f"{platform} returned 429, backing off for {retry_after:.0f}s")
+        block(platform, credential, retry_after)
+        return retry_after
+
+    for remaining_header in ('x-rate-limit-remaining', 'x-user-limit-24hour-remaining'):
+        remaining = headers.get(remaining_header)
+        if remaining is not None and remaining.strip() == '0':
+            retry_after = parse_retry_after(headers)
+            logger.info(f"{platform} budget exhausted ({remaining_header}), pausing for {retry_after:.0f}s")
+            block(platform, credential, retry_after)
+            return retry_after
+    return None
+
+def check_response(platform, credential, response):
+    # Record rate-limit headers and raise for responses that should be retried later
+    retry_after = record_response(platform, credential, response.status_code, response.headers)
+    if response.status_code == 429:
+        raise RateLimited(platform, retry_after)
+    if response.status_code >= 500:
+        raise TransientError(f"{platform} returned {response.status_code}: {response.text[:200]}")
+
+async def check_response_async(platform, credential, response):
+    await asyncio.to_thread(check_response, platform, credential, response)
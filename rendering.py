@@ -0,0 +1,129 @@
+import re
+import markdown
+from html import unescape
+from tweet_splitter import split_thread
+
+# Bump when the output of render_post changes so cached renders are recomputed
+RENDERER_VERSION = 4
+
+# Splits markdown's HTML output into alternating text runs and tags in a single pass.
+# Comments (which may contain '>'), declarations and processing instructions are split
+# out too, so they can be dropped instead of leaking into the text
+TAG_SPLIT_RE = re.compile(r'(<!--.*?-->|<[!?][^>]*>|<[^>]*>)', re.S)
+TAG_RE = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)')
+HREF_RE = re.compile(r'href\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+
+BLOCK_TAGS = frozenset(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'pre', 'blockquote', 'hr', 'div', 'table'])
+TEXT_BLOCK_TAGS = frozenset(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'pre', 'td', 'th'])
+
+def html_to_plain_text(html_content):
+    # Convert markdown-generated HTML into platform-ready plain text: paragraphs are
+    # separated by blank lines, list items get bullets or numbers (nested lists are
+    # indented), links keep their URL and code blocks keep their line breaks
+    parts = []
+    trailing = 0         # newlines at the end of the output so far
+    pending = 0          # newlines owed before the next text
+    lists = []           # [tag, item counter] per open list
+    links = []           # (href, output index) per open link
+    text_depth = 0       # open elements whose whitespace is content
+    pre_depth = 0
+    item_start = False   # a list marker was just written
+
+    def write(text):
+        nonlocal trailing, pending, item_start
+        item_start = False
+        if pending and parts and pending > trailing:
+            parts.append('\n' * (pending - trailing))
+            trailing = pending
+        pending = 0
+        parts.append(text)
+        stripped = text.rstrip('\n')
+        trailing = trailing + len(text) if not stripped else len(text) - len(stripped)
+
+    for index, token in enumerate(TAG_SPLIT_RE.split(html_content)):
+        match = TAG_RE.match(token) if index % 2 else None
+        if not match:
+            if not token or index % 2 and token.startswith(('<!', '<?')):
+                continue
+            if pre_depth:
+                write(unescape(token))
+            elif text_depth or not token.isspace() or '\n' not in token:
+                # Line breaks between block tags are markup formatting, not content
+                write(unescape(token) if '&' in token else token)
+            continue
+
+        closing, tag = match.groups()
+        tag = tag.lower()
+        if not closing:
+            if tag == 'br':
+                write('\n')
+            elif tag == 'li':
+                pending = max(pending, 1)
+                if lists:
+                    lists[-1][1] += 1
+                    kind, number = lists[-1]
+                    marker = f"{number}. " if kind == 'ol' else '• '
+                    write('  ' * (len(lists) - 1) + marker)
+                else:
+                    write('• ')
+                item_start = True
+            elif tag in ('ul', 'ol'):
+                pending = max(pending, 1 if lists else 2)
+                lists.append([tag, 0])
+            elif tag in BLOCK_TAGS:
+                # A paragraph opening a list item stays on the marker's line
+                if not item_start:
+                    pending = max(pending, 1 if lists else 2)
+                if tag in TEXT_BLOCK_TAGS:
+                    text_depth += 1
+                if tag == 'pre':
+                    pre_depth += 1
+            elif tag == 'a':
+                href = HREF_RE.search(token)
+                links.append((unescape(href.group(1) or href.group(2)) if href else None, len(parts)))
+            elif tag in TEXT_BLOCK_TAGS:
+                text_depth += 1
+        else:
+            if tag == 'li':
+                pending = max(pending, 1)
+            elif tag in ('ul', 'ol'):
+                if lists:
+                    lists.pop()
+                pending = max(pending, 1 if lists else 2)
+            elif tag in BLOCK_TAGS:
+                if tag in TEXT_BLOCK_TAGS:
+                    text_depth = max(text_depth - 1, 0)
+                if tag == 'pre':
+                    pre_depth = max(pre_depth - 1, 0)
+                pending = max(pending, 1 if lists else 2)
+            elif tag == 'a' and links:
+                href, start = links.pop()
+                if href and ''.join(parts[start:]).strip() != href:
+                    write(f" ({href})")
+            elif tag in TEXT_BLOCK_TAGS:
+                text_depth = max(text_depth - 1, 0)
+
+    return ''.join(parts).strip()
+
+def render_post(text):
+    # Everything the dashboard and the posters need, stored on the post as 'rendered':
+    # the LinkedIn commentary and the X thread are ready to send as they are
+    display_html = markdown.markdown(text)
+    plain_text = html_to_plain_text(display_html)
+    platform_text = plain_text.replace('<br>', '\n')
+    return {
+        'version': RENDERER_VERSION,
+        'display_html': display_html,
+        'plain_text': plain_text,
+        'linkedin_text': platform_text,
+        'twitter_segments': split_thread(platform_text)
+    }
+
+def get_rendered(post):
+    # The stored render is recomputed whenever the text is written and migrated by
+    # backfill_render_cache.py after a RENDERER_VERSION bump, so reads trust it. Posts
+    # without one (or with one from before the platform variants) are rendered on the fly.
+    rendered = post.get('rendered')
+    if rendered and 'twitter_segments' in rendered:
+        return rendered
+    return render_post(post['text'])
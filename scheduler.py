@@ -0,0 +1,207 @@
+import os
+import sys
+import time
+import heapq
+import logging
+import argparse
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytz
+from pymongo.errors import OperationFailure, PyMongoError
+from dotenv import load_dotenv
+from job_queue import collection, claim_next_post, process_post, worker_id
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(threadName)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Long-running alternative to the cron: keeps every queued post's due time in a min-heap,
+# sleeps until the earliest one and publishes it on time. The heap is kept current by a
+# MongoDB change stream (replica sets, Atlas); without change streams it is reloaded every
+# SCHEDULER_POLL_SECONDS instead.
+SCHEDULER_CONCURRENCY = int(os.environ.get('SCHEDULER_CONCURRENCY', 4))
+SCHEDULER_POLL_SECONDS = float(os.environ.get('SCHEDULER_POLL_SECONDS', 30))
+SCHEDULER_MAX_SLEEP_SECONDS = 3600
+# Delay before a post is dispatched again after its claim failed (e.g. MongoDB unreachable)
+SCHEDULER_RETRY_SECONDS = float(os.environ.get('SCHEDULER_RETRY_SECONDS', 5))
+
+QUEUE_QUERY = {'status': {'$in': ['Scheduled', 'Publishing']}}
+QUEUE_PROJECTION = {'status': 1, 'scheduled_time': 1, 'next_attempt_at': 1, 'lease_expires_at': 1}
+
+def due_at(post):
+    # When the job queue will next pick the post up (epoch seconds), or None if it won't
+    status = post.get('status')
+    if status == 'Scheduled':
+        times = [post.get('scheduled_time'), post.get('next_attempt_at')]
+    elif status == 'Publishing':
+        # A crashed publisher's lease expires and the post becomes claimable again
+        times = [post.get('lease_expires_at')]
+    else:
+        return None
+    times = [t.replace(tzinfo=pytz.UTC).timestamp() for t in times if t]
+    return max(times) if times else None
+
+class UpcomingPosts:
+    # Min-heap of (due time, post id); superseded entries are skipped lazily when popped
+    def __init__(self):
+        self.heap = []
+        self.due = {}
+        self.condition = threading.Condition()
+
+    def update(self, post_id, due_time):
+        with self.condition:
+            if due_time is None:
+                self.due.pop(post_id, None)
+            elif self.due.get(post_id) != due_time:
+                self.due[post_id] = due_time
+                heapq.heappush(self.heap, (due_time, post_id))
+            self.condition.notify()
+
+    def retry(self, post_id, due_time):
+        # Put back an entry whose claim failed, unless the queue changed it in the meantime
+        with self.condition:
+            if post_id not in self.due:
+                self.due[post_id] = due_time
+                heapq.heappush(self.heap, (due_time, post_id))
+                self.condition.notify()
+
+    def replace_all(self, posts):
+        with self.condition:
+            due_times = ((post['_id'], due_at(post)) for post in posts)
+            self.due = {post_id: due_time for post_id, due_time in due_times if due_time is not None}
+            self.heap = [(due_time, post_id) for post_id, due_time in self.due.items()]
+            heapq.heapify(self.heap)
+            self.condition.notify()
+
+    def next_due(self):
+        while self.heap and self.due.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now):
+        due_posts = []
+        while self.next_due() is not None and self.heap[0][0] <= now:
+            _, post_id = heapq.heappop(self.heap)
+            del self.due[post_id]
+            due_posts.append(post_id)
+        return due_posts
+
+def load(upcoming):
+    posts = list(collection.find(QUEUE_QUERY, QUEUE_PROJECTION))
+    upcoming.replace_all(posts)
+    logger.info(f"Loaded {len(upcoming.due)} queued post(s)")
+
+def watch(upcoming, stop_event):
+    # Follow inserts, edits and deletes on the posts collection; returns False if the
+    # deployment doesn't support change streams
+    resume_token = None
+    while not stop_event.is_set():
+        try:
+            with collection.watch(full_document='updateLookup', resume_after=resume_token) as stream:
+                if resume_token is None:
+                    # Load after the stream is open so no change falls in between
+                    load(upcoming)
+                for change in stream:
+                    resume_token = change['_id']
+                    post_id = change['documentKey']['_id']
+                    post = change.get('fullDocument')
+                    upcoming.update(post_id, due_at(post) if post else None)
+        except OperationFailure as e:
+            if resume_token is None:
+                logger.warning(f"Change streams unavailable, falling back to polling: {str(e)}")
+                return False
+            logger.warning(f"Change stream could not resume, reloading: {str(e)}")
+            resume_token = None
+        except PyMongoError as e:
+            logger.error(f"Change stream interrupted: {str(e)}")
+            stop_event.wait(5)
+    return True
+
+def poll(upcoming, stop_event, poll_seconds):
+    while not stop_event.is_set():
+        try:
+            load(upcoming)
+        except PyMongoError as e:
+            logger.error(f"Failed to load queued posts: {str(e)}")
+        stop_event.wait(poll_seconds)
+
+def track(upcoming, stop_event, poll_seconds, use_change_streams):
+    if use_change_streams and watch(upcoming, stop_event):
+        return
+    poll(upcoming, stop_event, poll_seconds)
+
+def dispatch(upcoming, post_id, owner):
+    # The queue claim picks the earliest due post; another scheduler may already have it
+    try:
+        post = claim_next_post(owner)
+    except PyMongoError as e:
+        # The entry was already popped, so without this nothing would dispatch it again
+        logger.error(f"Failed to claim due post, retrying in {SCHEDULER_RETRY_SECONDS}s: {str(e)}")
+        upcoming.retry(post_id, time.time() + SCHEDULER_RETRY_SECONDS)
+        return
+    try:
+        if post:
+            process_post(post, owner)
+    except Exception as e:
+        logger.error(f"Failed to publish due post: {str(e)}", exc_info=True)
+
+def run(upcoming, stop_event, concurrency):
+    owner = worker_id()
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='publish')
+    logger.info(f"Scheduler {owner} started")
+    while not stop_event.is_set():
+        with upcoming.condition:
+            next_due = upcoming.next_due()
+            wait = SCHEDULER_MAX_SLEEP_SECONDS if next_due is None else next_due - time.time()
+            if wait > 0:
+                # Woken early by a change to the queue or by shutdown
+                upcoming.condition.wait(min(wait, SCHEDULER_MAX_SLEEP_SECONDS))
+                continue
+            due_posts = upcoming.pop_due(time.time())
+
+        logger.info(f"Dispatching {len(due_posts)} due post(s)")
+        for post_id in due_posts:
+            executor.submit(dispatch, upcoming, post_id, owner)
+    executor.shutdown(wait=True)
+    logger.info(f"Scheduler {owner} stopped")
+
+def main():
+    parser = argparse.ArgumentParser(description='Publish scheduled posts at their scheduled time')
+    parser.add_argument('--concurrency', type=int, default=SCHEDULER_CONCURRENCY, help='number of concurrent publishes')
+    parser.add_argument('--poll-seconds', type=float, default=SCHEDULER_POLL_SECONDS, help='reload interval without change streams')
+    parser.add_argument('--no-change-streams', action='store_true', help='always poll instead of following a change stream')
+    args = parser.parse_args()
+
+    upcoming = UpcomingPosts()
+    stop_event = threading.Event()
+
+    def stop(signum=None, frame=None):
+        stop_event.set()
+        with upcoming.condition:
+            upcoming.condition.notify_all()
+
+    signal.signal(signal.SIGTERM, stop)
+    tracker = threading.Thread(
+        target=track,
+        args=(upcoming, stop_event, args.poll_seconds, not args.no_change_streams),
+        name='tracker',
+        daemon=True
+    )
+    tracker.start()
+
+    try:
+        run(upcoming, stop_event, args.concurrency)
+    except KeyboardInterrupt:
+        logger.info("Shutting down scheduler...")
+        stop()
+
+if __name__ == '__main__':
+    main()
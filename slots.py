@@ -0,0 +1,100 @@
+import logging
+from datetime import datetime, timedelta
+import pytz
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError, PyMongoError
+from database import db
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+IST = pytz.timezone('Asia/Kolkata')
+SLOT_HOURS = [10, 17, 21]  # 10 AM, 5 PM, 9 PM
+SLOT_SEARCH_DAYS = 30
+DUPLICATE_KEY_ERROR = 11000
+
+collection = db['posts']
+# One document per taken slot; the slot time is the _id so a slot can only be reserved once
+reservations = db['slot_reservations']
+
+def ensure_indexes():
+    try:
+        collection.create_index([('scheduled_time', ASCENDING)])
+    except PyMongoError as e:
+        logger.warning(f"Failed to create scheduled_time index: {str(e)}")
+
+def slot_key(slot):
+    # Reservation ids are naive UTC, matching how MongoDB returns datetimes
+    if slot.tzinfo:
+        slot = slot.astimezone(pytz.UTC).replace(tzinfo=None)
+    return slot
+
+def candidate_slots(now, days=SLOT_SEARCH_DAYS):
+    current_date = now.date()
+    for _ in range(days):
+        for hour in SLOT_HOURS:
+            slot = IST.localize(datetime.combine(current_date, datetime.min.time().replace(hour=hour)))
+            if slot > now:
+                yield slot
+        current_date += timedelta(days=1)
+
+def occupied_slots(first, last):
+    # Taken slots in the window, from both scheduled posts and reservations, in two range queries
+    time_range = {'$gte': first.astimezone(pytz.UTC), '$lte': last.astimezone(pytz.UTC)}
+    occupied = set()
+    for post in collection.find({'scheduled_time': time_range}, {'scheduled_time': 1, '_id': 0}):
+        occupied.add(post['scheduled_time'].replace(tzinfo=pytz.UTC))
+    for reservation in reservations.find({'_id': time_range}):
+        occupied.add(reservation['_id'].replace(tzinfo=pytz.UTC))
+    return occupied
+
+def free_slots(start_time=None):
+    # Yield free slots in order, one window of SLOT_SEARCH_DAYS at a time
+    now = start_time or datetime.now(IST)
+    while True:
+        window = list(candidate_slots(now))
+        occupied = occupied_slots(window[0], window[-1])
+        for slot in window:
+            if slot.astimezone(pytz.UTC) not in occupied:
+                yield slot
+        now = window[-1]
+
+def find_next_available_slot(start_time=None):
+    logger.info("Finding next available slot")
+    with span('find_next_available_slot'):
+        slot = next(free_slots(start_time))
+    logger.info(f"Next available slot found: {slot}")
+    return slot
+
+def reserve_slots(count=1, start_time=None):
+    # Reserve the next `count` free slots with one bulk insert. A slot taken concurrently
+    # by another request fails on the unique _id and is replaced by the next free one.
+    reserved = []
+    slots = free_slots(start_time)
+    with span('reserve_slots'):
+        while len(reserved) < count:
+            batch = [next(slots) for _ in range(count - len(reserved))]
+            now = datetime.now(pytz.UTC)
+            try:
+                reservations.insert_many(
+                    [{'_id': slot_key(slot), 'reserved_at': now} for slot in batch],
+                    ordered=False
+                )
+                reserved.extend(batch)
+            except BulkWriteError as e:
+                errors = e.details.get('writeErrors', [])
+                if any(error['code'] != DUPLICATE_KEY_ERROR for error in errors):
+                    raise
+                taken = {error['index'] for error in errors}
+                reserved.extend(slot for i, slot in enumerate(batch) if i not in taken)
+                logger.info(f"{len(taken)} slot(s) were reserved concurrently, trying the next free ones")
+
+    reserved.sort()
+    logger.info(f"Reserved {len(reserved)} slot(s): {[slot.isoformat() for slot in reserved]}")
+    return reserved
+
+def reserve_next_slot(start_time=None):
+    return reserve_slots(1, start_time)[0]
+
+def release_slot(scheduled_time):
+    reservations.delete_one({'_id': slot_key(scheduled_time)})
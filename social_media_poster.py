@@ -1,39 +1,53 @@
-import requests
-import os
-import tweepy
+import time
 import logging
-import io
 import json
+import asyncio
+from datetime import datetime, timedelta
+import pytz
+import aiohttp
+import tweepy
 from dotenv import load_dotenv
+from media_staging import is_video, read_chunk
+from rate_limiter import TransientError, acquire, acquire_async, check_response, check_response_async, record_response
+import http_clients
+from identity_cache import get_cached_person_urn, cache_person_urn, invalidate_person_urn
+from idempotency import DuplicatePublish, call_once, call_once_async
+from metrics import sample_verbose, span
+from media_upload import (LINKEDIN_MULTIPART_THRESHOLD, TWITTER_CHUNKED_THRESHOLD, chunk_ranges, clear_progress,
+                          load_progress, retryable_errors, save_progress, upload_key, with_retries, with_retries_async)
 
 load_dotenv()
 
-# LinkedIn credentials
-LINKEDIN_ACCESS_TOKEN = os.environ.get('LINKEDIN_ACCESS_TOKEN')
-LINKEDIN_ACCESS_TOKEN_2 = os.environ.get('LINKEDIN_ACCESS_TOKEN_2')
+LINKEDIN_USERINFO_URL = 'https://api.linkedin.com/v2/userinfo'
+LINKEDIN_REGISTER_URL = 'https://api.linkedin.com/v2/assets?action=registerUpload'
+LINKEDIN_SHARE_URL = 'https://api.linkedin.com/v2/ugcPosts'
+TWITTER_TWEETS_URL = 'https://api.twitter.com/2/tweets'
+LINKEDIN_COMPLETE_UPLOAD_URL = 'https://api.linkedin.com/v2/assets?action=completeMultiPartUpload'
+TWITTER_MEDIA_UPLOAD_URL = 'https://upload.twitter.com/1.1/media/upload.json'
+LINKEDIN_SINGLE_UPLOAD = 'com.linkedin.digitalmedia.uploading.MediaUploadHttpRequest'
+LINKEDIN_MULTIPART_UPLOAD = 'com.linkedin.digitalmedia.uploading.MultipartUpload'
+# How long to wait for X to finish processing uploaded video before deferring the post
+TWITTER_PROCESSING_TIMEOUT = 300
 
-# Twitter credentials for first account
-TWITTER_API_KEY = os.environ.get('TWITTER_API_KEY')
-TWITTER_API_SECRET = os.environ.get('TWITTER_API_SECRET')
-TWITTER_ACCESS_TOKEN = os.getenv('TWITTER_ACCESS_TOKEN')
-TWITTER_ACCESS_TOKEN_SECRET = os.getenv('TWITTER_ACCESS_TOKEN_SECRET')
+def get_linkedin_person_urn(token):
+    person_urn = get_cached_person_urn(token)
+    if person_urn:
+        return person_urn
 
-# Twitter credentials for second account
-TWITTER_API_KEY_2 = os.environ.get('TWITTER_API_KEY_2')
-TWITTER_API_SECRET_2 = os.environ.get('TWITTER_API_SECRET_2')
-TWITTER_ACCESS_TOKEN_2 = os.getenv('TWITTER_ACCESS_TOKEN_2')
-TWITTER_ACCESS_TOKEN_SECRET_2 = os.getenv('TWITTER_ACCESS_TOKEN_SECRET_2')
+    person_urn = fetch_linkedin_person_urn(token)
+    if person_urn:
+        cache_person_urn(token, person_urn)
+    return person_urn
 
-def get_linkedin_person_urn(token):
-    url = 'https://api.linkedin.com/v2/userinfo'
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Content-Type': 'application/json'
-    }
-    
-    response = requests.get(url, headers=headers)
+def fetch_linkedin_person_urn(token):
+    response = http_clients.get(LINKEDIN_USERINFO_URL, headers=linkedin_headers(token), stage='linkedin_userinfo')
+    check_response('linkedin', token, response)
+    return person_urn_from(response, token)
+
+def person_urn_from(response, token):
     logging.info(f"LinkedIn API response status code: {response.status_code}")
-    logging.info(f"LinkedIn API response content: {response.text}")
+    if sample_verbose():
+        logging.info(f"LinkedIn API response content: {response.text}")
     
     if response.status_code == 200:
         try:
@@ -48,160 +62,539 @@ def get_linkedin_person_urn(token):
             logging.error(f"Response content: {response.text}")
             return None
     else:
+        if response.status_code == 401:
+            invalidate_person_urn(token)
         logging.error(f"Failed to fetch LinkedIn user info. Status code: {response.status_code}")
         logging.error(f"Response content: {response.text}")
         return None
 
-def register_image_with_linkedin(image_url, token):
-    register_url = 'https://api.linkedin.com/v2/assets?action=registerUpload'
-    headers = {
+def linkedin_headers(token):
+    return {
         'Authorization': f'Bearer {token}',
         'Content-Type': 'application/json'
     }
-    data = {
-        "registerUploadRequest": {
-            "recipes": ["urn:li:digitalmediaRecipe:feedshare-image"],
-            "owner": get_linkedin_person_urn(token),
-            "serviceRelationships": [{
-                "relationshipType": "OWNER",
-                "identifier": "urn:li:userGeneratedContent"
-            }]
-        }
-    }
-    response = requests.post(register_url, headers=headers, json=data)
-    if response.status_code == 200:
-        response_data = response.json()
-        asset = response_data['value']['asset']
-        upload_url = response_data['value']['uploadMechanism']['com.linkedin.digitalmedia.uploading.MediaUploadHttpRequest']['uploadUrl']
-        
-        # Upload the image
-        with requests.get(image_url, stream=True) as r:
-            r.raise_for_status()
-            upload_response = requests.put(upload_url, data=r.content, headers={'Content-Type': 'image/jpeg'})
-        
-        if upload_response.status_code == 201:
-            return asset  # Return the full asset URN
-        else:
-            logging.error(f"Failed to upload image to LinkedIn. Status code: {upload_response.status_code}")
-            logging.error(f"Response content: {upload_response.text}")
-            return None
-    else:
-        logging.error(f"Failed to register image with LinkedIn. Status code: {response.status_code}")
-        logging.error(f"Response content: {response.text}")
+
+def register_image_with_linkedin(media, token, person_urn=None):
+    # Register the staged media and upload it: one streamed PUT, or part by part for large
+    # video. A multipart upload interrupted by a failure resumes at the next part next time.
+    if not media:
         return None
 
-def post_to_linkedin(text, image_url):
-    results = []
-    for token in [LINKEDIN_ACCESS_TOKEN, LINKEDIN_ACCESS_TOKEN_2]:
-        url = 'https://api.linkedin.com/v2/ugcPosts'
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
+    key = upload_key('linkedin', token, media)
+    upload = load_progress(key)
+    if not upload:
+        data = linkedin_register_payload(person_urn or get_linkedin_person_urn(token), media)
+        response = http_clients.post(LINKEDIN_REGISTER_URL, headers=linkedin_headers(token), json=data,
+                                     stage='linkedin_register_upload')
+        check_response('linkedin', token, response)
+        if response.status_code != 200:
+            if response.status_code == 401:
+                invalidate_person_urn(token)
+            logging.error(f"Failed to register image with LinkedIn. Status code: {response.status_code}")
+            logging.error(f"Response content: {response.text}")
+            return None
+        upload = linkedin_upload_target(response.json())
+        if 'parts' in upload:
+            save_progress(key, upload)
+
+    if 'parts' not in upload:
+        upload_response = with_retries(put_linkedin_media, upload['upload_url'], media, token)
+        return uploaded_asset(upload['asset'], upload_response)
+
+    for index, part in enumerate(upload['parts']):
+        if upload['etags'][index]:
+            continue
+        chunk = read_chunk(media, part['first_byte'], part['last_byte'] - part['first_byte'] + 1)
+        part_response = with_retries(put_linkedin_part, part, chunk, token)
+        if part_response.status_code not in (200, 201):
+            clear_progress(key)
+            return uploaded_asset(upload['asset'], part_response)
+        upload['etags'][index] = part_response.headers.get('ETag')
+        save_progress(key, upload)
+
+    response = with_retries(complete_linkedin_upload, upload, token)
+    clear_progress(key)
+    return uploaded_asset(upload['asset'], response)
+
+def put_linkedin_media(upload_url, media, token):
+    # requests streams the open file, so the upload never holds the whole image in memory
+    with open(media['path'], 'rb') as f:
+        response = http_clients.put(upload_url, data=f, headers={'Content-Type': media['content_type']},
+                                    stage='linkedin_image_upload')
+    check_response('linkedin', token, response)
+    return response
+
+def put_linkedin_part(part, chunk, token):
+    response = http_clients.put(part['url'], data=chunk, headers=part['headers'], stage='linkedin_part_upload')
+    check_response('linkedin', token, response)
+    return response
+
+def complete_linkedin_upload(upload, token):
+    response = http_clients.post(LINKEDIN_COMPLETE_UPLOAD_URL, headers=linkedin_headers(token),
+                                 json=linkedin_complete_payload(upload), stage='linkedin_complete_upload')
+    check_response('linkedin', token, response)
+    return response
+
+def linkedin_register_payload(person_urn, media=None):
+    video = bool(media) and is_video(media)
+    request = {
+        "recipes": ["urn:li:digitalmediaRecipe:feedshare-video" if video else "urn:li:digitalmediaRecipe:feedshare-image"],
+        "owner": person_urn,
+        "serviceRelationships": [{
+            "relationshipType": "OWNER",
+            "identifier": "urn:li:userGeneratedContent"
+        }]
+    }
+    if media and media['size'] > LINKEDIN_MULTIPART_THRESHOLD:
+        request["supportedUploadMechanism"] = ["MULTIPART_UPLOAD"]
+        request["fileSize"] = media['size']
+    return {"registerUploadRequest": request}
+
+def linkedin_upload_target(response_data):
+    # Where to send the bytes: a single upload URL, or byte ranges for a multipart upload
+    value = response_data['value']
+    mechanism = value['uploadMechanism']
+    if LINKEDIN_MULTIPART_UPLOAD in mechanism:
+        multipart = mechanism[LINKEDIN_MULTIPART_UPLOAD]
+        parts = [{
+            'url': part['url'],
+            'first_byte': part['byteRange']['firstByte'],
+            'last_byte': part['byteRange']['lastByte'],
+            'headers': part.get('headers') or {}
+        } for part in multipart['partUploadRequests']]
+        return {
+            'asset': value['asset'],
+            'media_artifact': value.get('mediaArtifact'),
+            'metadata': multipart.get('metadata'),
+            'parts': parts,
+            'etags': [None] * len(parts)
         }
-        
+    return {'asset': value['asset'], 'upload_url': mechanism[LINKEDIN_SINGLE_UPLOAD]['uploadUrl']}
+
+def linkedin_complete_payload(upload):
+    return {
+        "completeMultipartUploadRequest": {
+            "mediaArtifact": upload['media_artifact'],
+            "metadata": upload['metadata'],
+            "partUploadResponses": [{"headers": {"ETag": etag}, "httpStatusCode": 200} for etag in upload['etags']]
+        }
+    }
+
+def uploaded_asset(asset, upload_response):
+    if upload_response.status_code in (200, 201):
+        return asset  # Return the full asset URN
+    logging.error(f"Failed to upload image to LinkedIn. Status code: {upload_response.status_code}")
+    logging.error(f"Response content: {upload_response.text}")
+    return None
+
+def linkedin_media_category(media):
+    # Without staged media the asset was uploaded earlier; posts only carry images today
+    return 'VIDEO' if media and is_video(media) else 'IMAGE'
+
+def post_to_linkedin_account(text, media, token, asset_urn=None, idempotency_key=None):
+    # asset_urn is an image uploaded by an earlier attempt; reusing it skips the upload.
+    # idempotency_key makes sure the share goes out at most once per post and account.
+    try:
+        acquire('linkedin', token)
         person_urn = get_linkedin_person_urn(token)
         if not person_urn:
-            results.append({'error': 'Failed to fetch LinkedIn person URN'})
-            continue
-        
-        asset_urn = register_image_with_linkedin(image_url, token)
+            return {'error': 'Failed to fetch LinkedIn person URN'}
+
         if not asset_urn:
-            results.append({'error': 'Failed to register image with LinkedIn'})
-            continue
-        
-        # Extract the digitalmediaAsset part from the asset_urn
-        asset_id = asset_urn.split(',')[0].split(':')[-1]
-        
-        # Replace <br> tags with \n for LinkedIn
-        linkedin_text = text.replace('<br>', '\n')
-        
-        data = {
-            'author': person_urn,
-            'lifecycleState': 'PUBLISHED',
-            'specificContent': {
-                'com.linkedin.ugc.ShareContent': {
-                    'shareCommentary': {
-                        'text': linkedin_text
-                    },
-                    'shareMediaCategory': 'IMAGE',
-                    'media': [
-                        {
-                            'status': 'READY',
-                            'description': {
-                                'text': 'Image description'
-                            },
-                            'media': f'urn:li:digitalmediaAsset:{asset_id}'
-                        }
-                    ]
-                }
-            },
-            'visibility': {
-                'com.linkedin.ugc.MemberNetworkVisibility': 'PUBLIC'
+            asset_urn = register_image_with_linkedin(media, token, person_urn)
+            if not asset_urn:
+                return {'error': 'Failed to register image with LinkedIn'}
+
+        category = linkedin_media_category(media)
+        result = call_once(idempotency_key, lambda: share_on_linkedin(text, asset_urn, token, person_urn, category),
+                           lambda result: bool(result.get('id')))
+    except DuplicatePublish as e:
+        logging.warning(str(e))
+        result = {'error': str(e)}
+    except TransientError as e:
+        logging.warning(f"LinkedIn post deferred: {str(e)}")
+        result = {'error': str(e), 'retryable': True, 'retry_after': e.retry_after}
+    if asset_urn:
+        result['asset_urn'] = asset_urn
+    return result
+
+def share_on_linkedin(text, asset_urn, token, person_urn, category='IMAGE'):
+    response = http_clients.post(LINKEDIN_SHARE_URL, headers=linkedin_headers(token),
+                                 json=linkedin_share_payload(text, asset_urn, person_urn, category), stage='linkedin_share')
+    check_response('linkedin', token, response)
+    return share_result(response, token)
+
+def linkedin_share_payload(text, asset_urn, person_urn, category='IMAGE'):
+    # Extract the digitalmediaAsset part from the asset_urn
+    asset_id = asset_urn.split(',')[0].split(':')[-1]
+
+    return {
+        'author': person_urn,
+        'lifecycleState': 'PUBLISHED',
+        'specificContent': {
+            'com.linkedin.ugc.ShareContent': {
+                'shareCommentary': {
+                    'text': text
+                },
+                'shareMediaCategory': category,
+                'media': [
+                    {
+                        'status': 'READY',
+                        'description': {
+                            'text': 'Image description'
+                        },
+                        'media': f'urn:li:digitalmediaAsset:{asset_id}'
+                    }
+                ]
             }
+        },
+        'visibility': {
+            'com.linkedin.ugc.MemberNetworkVisibility': 'PUBLIC'
         }
-        
-        response = requests.post(url, headers=headers, json=data)
-        logging.info(f"LinkedIn post response status code: {response.status_code}")
+    }
+
+def share_result(response, token):
+    logging.info(f"LinkedIn post response status code: {response.status_code}")
+    if sample_verbose():
         logging.info(f"LinkedIn post response content: {response.text}")
-        
-        if response.status_code == 201:
-            try:
-                results.append(response.json())
-            except json.JSONDecodeError:
-                logging.error("Failed to decode JSON from LinkedIn post response")
-                results.append({'error': 'Failed to decode LinkedIn response'})
-        else:
-            logging.error(f"Failed to post to LinkedIn. Status code: {response.status_code}")
-            logging.error(f"Response content: {response.text}")
-            results.append({'error': f'Failed to post to LinkedIn: {response.text}'})
-    
-    return results
-
-def post_to_twitter(text, image_url=None):
-    results = []
-    for credentials in [
-        (TWITTER_API_KEY, TWITTER_API_SECRET, TWITTER_ACCESS_TOKEN, TWITTER_ACCESS_TOKEN_SECRET),
-        (TWITTER_API_KEY_2, TWITTER_API_SECRET_2, TWITTER_ACCESS_TOKEN_2, TWITTER_ACCESS_TOKEN_SECRET_2)
-    ]:
+
+    if response.status_code == 201:
         try:
-            api_key, api_secret, access_token, access_token_secret = credentials
-            client = tweepy.Client(
-                consumer_key=api_key,
-                consumer_secret=api_secret,
-                access_token=access_token,
-                access_token_secret=access_token_secret
-            )
-
-            # Replace <br> tags with \n for Twitter
-            twitter_text = text.replace('<br>', '\n')
-
-            # Truncate the text to 280 characters (Twitter's current limit)
-            truncated_text = twitter_text[:280]
-
-            if image_url:
-                # Download image
-                image_response = requests.get(image_url)
-                if image_response.status_code != 200:
-                    raise Exception(f"Failed to download image from URL. Status code: {image_response.status_code}")
-                
-                # Create a file-like object from the image content
-                image_file = io.BytesIO(image_response.content)
-                
-                # Upload image
-                auth = tweepy.OAuthHandler(api_key, api_secret)
-                auth.set_access_token(access_token, access_token_secret)
-                api = tweepy.API(auth)
-                media = api.media_upload(filename="temp_image.jpg", file=image_file)
-                
-                # Post tweet with image
-                response = client.create_tweet(text=truncated_text, media_ids=[media.media_id])
-            else:
-                # Post tweet without image
-                response = client.create_tweet(text=truncated_text)
-            
-            results.append({'tweet_id': response.data['id']})
-        except Exception as e:
-            logging.error(f"Error posting to Twitter: {str(e)}")
-            results.append({'error': f'Error posting to Twitter: {str(e)}'})
-    
-    return results
\ No newline at end of file
+            return response.json()
+        except json.JSONDecodeError:
+            logging.error("Failed to decode JSON from LinkedIn post response")
+            return {'error': 'Failed to decode LinkedIn response'}
+    else:
+        if response.status_code == 401:
+            invalidate_person_urn(token)
+        logging.error(f"Failed to post to LinkedIn. Status code: {response.status_code}")
+        logging.error(f"Response content: {response.text}")
+        return {'error': f'Failed to post to LinkedIn: {response.text}'}
+
+def post_to_twitter_account(segments, media, credentials, posted_ids=None, media_id=None, idempotency_key=None):
+    # segments is the post's stored X thread (rendered['twitter_segments']); posted_ids holds
+    # tweets already sent by an earlier attempt so a retry resumes after the last successful
+    # tweet, and media_id an image it already uploaded. Each tweet is sent at most once per
+    # idempotency_key.
+    tweet_ids = list(posted_ids or [])
+    try:
+        client, api = http_clients.get_twitter_clients(credentials)
+
+        for index, segment in enumerate(segments):
+            if index < len(tweet_ids):
+                continue
+
+            kwargs = {'text': segment}
+            if tweet_ids:
+                kwargs['in_reply_to_tweet_id'] = tweet_ids[-1]
+            elif media_id or media:
+                # Upload the staged media and attach it to the first tweet
+                if not media_id:
+                    with span('twitter_call', step='media_upload'):
+                        media_id = upload_twitter_media(api, media, credentials)
+                kwargs['media_ids'] = [media_id]
+
+            acquire('twitter', credentials[2])
+            with span('twitter_call', step='create_tweet'):
+                tweet_ids.append(call_once(
+                    idempotency_key and f"{idempotency_key}:{index}",
+                    lambda: create_tweet(client, credentials, kwargs)
+                ))
+
+        return {'tweet_id': tweet_ids[0], 'tweet_ids': tweet_ids, 'media_id': media_id}
+    except tweepy.TooManyRequests as e:
+        retry_after = record_response('twitter', credentials[2], 429, e.response.headers)
+        logging.warning(f"Twitter rate limit reached, retry in {retry_after:.0f}s")
+        return {'error': f'Twitter rate limit reached: {str(e)}', 'tweet_ids': tweet_ids, 'media_id': media_id,
+                'retryable': True, 'retry_after': retry_after}
+    except (tweepy.TwitterServerError, TransientError) as e:
+        logging.warning(f"Twitter post deferred: {str(e)}")
+        return {'error': f'Error posting to Twitter: {str(e)}', 'tweet_ids': tweet_ids, 'media_id': media_id,
+                'retryable': True, 'retry_after': getattr(e, 'retry_after', None)}
+    except Exception as e:
+        logging.error(f"Error posting to Twitter: {str(e)}")
+        return {'error': f'Error posting to Twitter: {str(e)}', 'tweet_ids': tweet_ids, 'media_id': media_id}
+
+def create_tweet(client, credentials, kwargs):
+    # The client returns the raw response, so X's rate-limit headers reach the limiter on
+    # success too, not only once it answers 429
+    response = client.create_tweet(**kwargs)
+    record_response('twitter', credentials[2], response.status_code, response.headers)
+    return response.json()['data']['id']
+
+def upload_twitter_media(api, media, credentials):
+    # Small images go up in one request; video, GIFs and large images use the chunked
+    # INIT/APPEND/FINALIZE flow, resuming after the last appended chunk on a later attempt
+    if not twitter_chunked(media):
+        with open(media['path'], 'rb') as f:
+            return api.media_upload(filename=media['filename'], file=f).media_id
+
+    key = upload_key('twitter', credentials[2], media)
+    upload = load_progress(key)
+    try:
+        if not upload:
+            init = api.chunked_upload_init(media['size'], media['content_type'], media_category=twitter_media_category(media))
+            upload = save_progress(key, {'media_id': init.media_id, 'next_segment': 0},
+                                   upload_expiry(getattr(init, 'expires_after_secs', None)))
+
+        for index, offset, length in chunk_ranges(media['size']):
+            if index < upload['next_segment']:
+                continue
+            with_retries(api.chunked_upload_append, upload['media_id'], read_chunk(media, offset, length), index)
+            upload['next_segment'] = index + 1
+            save_progress(key, upload)
+
+        result = with_retries(api.chunked_upload_finalize, upload['media_id'])
+    except (retryable_errors() + (tweepy.TooManyRequests,)):
+        raise
+    except Exception:
+        # e.g. the upload session expired; start over on the next attempt
+        clear_progress(key)
+        raise
+    clear_progress(key)
+
+    processing_info = getattr(result, 'processing_info', None)
+    deadline = time.monotonic() + TWITTER_PROCESSING_TIMEOUT
+    while processing_info and processing_info.get('state') in ('pending', 'in_progress'):
+        if time.monotonic() > deadline:
+            raise TransientError("X is still processing the uploaded media")
+        time.sleep(processing_info.get('check_after_secs', 1))
+        processing_info = getattr(api.get_media_upload_status(upload['media_id']), 'processing_info', None)
+    if processing_info and processing_info.get('state') == 'failed':
+        raise Exception(f"X could not process the uploaded media: {processing_info.get('error')}")
+    return upload['media_id']
+
+def twitter_chunked(media):
+    return is_video(media) or media['content_type'] == 'image/gif' or media['size'] > TWITTER_CHUNKED_THRESHOLD
+
+def twitter_media_category(media):
+    if is_video(media):
+        return 'tweet_video'
+    return 'tweet_gif' if media['content_type'] == 'image/gif' else 'tweet_image'
+
+def upload_expiry(expires_after_secs):
+    return datetime.now(pytz.UTC) + timedelta(seconds=expires_after_secs) if expires_after_secs else None
+
+# Async versions of the account posters for the async server (async_app.py). They make the
+# same calls with the same idempotency keys and rate limits; shared helpers that may touch
+# MongoDB (identity cache, rate-limit bookkeeping) run on a thread.
+
+async def get_linkedin_person_urn_async(token):
+    person_urn = await asyncio.to_thread(get_cached_person_urn, token)
+    if person_urn:
+        return person_urn
+
+    response = await http_clients.async_get(LINKEDIN_USERINFO_URL, headers=linkedin_headers(token), stage='linkedin_userinfo')
+    await check_response_async('linkedin', token, response)
+    person_urn = await asyncio.to_thread(person_urn_from, response, token)
+    if person_urn:
+        await asyncio.to_thread(cache_person_urn, token, person_urn)
+    return person_urn
+
+async def register_image_with_linkedin_async(media, token, person_urn):
+    if not media:
+        return None
+
+    key = upload_key('linkedin', token, media)
+    upload = await asyncio.to_thread(load_progress, key)
+    if not upload:
+        response = await http_clients.async_post(LINKEDIN_REGISTER_URL, headers=linkedin_headers(token),
+                                                 json=linkedin_register_payload(person_urn, media), stage='linkedin_register_upload')
+        await check_response_async('linkedin', token, response)
+        if response.status_code != 200:
+            if response.status_code == 401:
+                await asyncio.to_thread(invalidate_person_urn, token)
+            logging.error(f"Failed to register image with LinkedIn. Status code: {response.status_code}")
+            logging.error(f"Response content: {response.text}")
+            return None
+        upload = linkedin_upload_target(response.json())
+        if 'parts' in upload:
+            await asyncio.to_thread(save_progress, key, upload)
+
+    if 'parts' not in upload:
+        upload_response = await with_retries_async(put_linkedin_media_async, upload['upload_url'], media, token)
+        return uploaded_asset(upload['asset'], upload_response)
+
+    for index, part in enumerate(upload['parts']):
+        if upload['etags'][index]:
+            continue
+        chunk = await asyncio.to_thread(read_chunk, media, part['first_byte'], part['last_byte'] - part['first_byte'] + 1)
+        part_response = await with_retries_async(put_linkedin_part_async, part, chunk, token)
+        if part_response.status_code not in (200, 201):
+            await asyncio.to_thread(clear_progress, key)
+            return uploaded_asset(upload['asset'], part_response)
+        upload['etags'][index] = part_response.headers.get('ETag')
+        await asyncio.to_thread(save_progress, key, upload)
+
+    response = await with_retries_async(complete_linkedin_upload_async, upload, token)
+    await asyncio.to_thread(clear_progress, key)
+    return uploaded_asset(upload['asset'], response)
+
+async def put_linkedin_media_async(upload_url, media, token):
+    # aiohttp reads the open file in the background as it sends
+    with open(media['path'], 'rb') as f:
+        response = await http_clients.async_put(upload_url, data=f, headers={'Content-Type': media['content_type']},
+                                                stage='linkedin_image_upload')
+    await check_response_async('linkedin', token, response)
+    return response
+
+async def put_linkedin_part_async(part, chunk, token):
+    response = await http_clients.async_put(part['url'], data=chunk, headers=part['headers'], stage='linkedin_part_upload')
+    await check_response_async('linkedin', token, response)
+    return response
+
+async def complete_linkedin_upload_async(upload, token):
+    response = await http_clients.async_post(LINKEDIN_COMPLETE_UPLOAD_URL, headers=linkedin_headers(token),
+                                             json=linkedin_complete_payload(upload), stage='linkedin_complete_upload')
+    await check_response_async('linkedin', token, response)
+    return response
+
+async def share_on_linkedin_async(text, asset_urn, token, person_urn, category='IMAGE'):
+    response = await http_clients.async_post(LINKEDIN_SHARE_URL, headers=linkedin_headers(token),
+                                             json=linkedin_share_payload(text, asset_urn, person_urn, category),
+                                             stage='linkedin_share')
+    await check_response_async('linkedin', token, response)
+    return await asyncio.to_thread(share_result, response, token)
+
+async def post_to_linkedin_account_async(text, media, token, asset_urn=None, idempotency_key=None):
+    try:
+        await acquire_async('linkedin', token)
+        person_urn = await get_linkedin_person_urn_async(token)
+        if not person_urn:
+            return {'error': 'Failed to fetch LinkedIn person URN'}
+
+        if not asset_urn:
+            asset_urn = await register_image_with_linkedin_async(media, token, person_urn)
+            if not asset_urn:
+                return {'error': 'Failed to register image with LinkedIn'}
+
+        category = linkedin_media_category(media)
+        result = await call_once_async(idempotency_key,
+                                       lambda: share_on_linkedin_async(text, asset_urn, token, person_urn, category),
+                                       lambda result: bool(result.get('id')))
+    except DuplicatePublish as e:
+        logging.warning(str(e))
+        result = {'error': str(e)}
+    except TransientError as e:
+        logging.warning(f"LinkedIn post deferred: {str(e)}")
+        result = {'error': str(e), 'retryable': True, 'retry_after': e.retry_after}
+    if asset_urn:
+        result['asset_urn'] = asset_urn
+    return result
+
+async def upload_twitter_media_async(media, credentials):
+    if not twitter_chunked(media):
+        with open(media['path'], 'rb') as f:
+            form = aiohttp.FormData()
+            form.add_field('media', f, filename=media['filename'], content_type=media['content_type'])
+            return (await twitter_media_command_async(credentials, form, 'twitter_media_upload'))['media_id']
+
+    key = upload_key('twitter', credentials[2], media)
+    upload = await asyncio.to_thread(load_progress, key)
+    try:
+        if not upload:
+            init = await twitter_media_command_async(credentials, {
+                'command': 'INIT',
+                'total_bytes': str(media['size']),
+                'media_type': media['content_type'],
+                'media_category': twitter_media_category(media)
+            }, 'twitter_media_init')
+            upload = await asyncio.to_thread(save_progress, key, {'media_id': init['media_id'], 'next_segment': 0},
+                                             upload_expiry(init.get('expires_after_secs')))
+
+        for index, offset, length in chunk_ranges(media['size']):
+            if index < upload['next_segment']:
+                continue
+            chunk = await asyncio.to_thread(read_chunk, media, offset, length)
+            await with_retries_async(append_twitter_chunk_async, credentials, upload['media_id'], index, chunk)
+            upload['next_segment'] = index + 1
+            await asyncio.to_thread(save_progress, key, upload)
+
+        result = await with_retries_async(twitter_media_command_async, credentials, {
+            'command': 'FINALIZE',
+            'media_id': str(upload['media_id'])
+        }, 'twitter_media_finalize')
+    except retryable_errors():
+        raise
+    except Exception:
+        await asyncio.to_thread(clear_progress, key)
+        raise
+    await asyncio.to_thread(clear_progress, key)
+
+    processing_info = result.get('processing_info')
+    deadline = time.monotonic() + TWITTER_PROCESSING_TIMEOUT
+    while processing_info and processing_info.get('state') in ('pending', 'in_progress'):
+        if time.monotonic() > deadline:
+            raise TransientError("X is still processing the uploaded media")
+        await asyncio.sleep(processing_info.get('check_after_secs', 1))
+        status_url = f"{TWITTER_MEDIA_UPLOAD_URL}?command=STATUS&media_id={upload['media_id']}"
+        headers = {'Authorization': http_clients.twitter_auth_header(credentials, 'GET', status_url)}
+        response = await http_clients.async_get(status_url, headers=headers, stage='twitter_media_status')
+        await check_response_async('twitter', credentials[2], response)
+        processing_info = response.json().get('processing_info')
+    if processing_info and processing_info.get('state') == 'failed':
+        raise Exception(f"X could not process the uploaded media: {processing_info.get('error')}")
+    return upload['media_id']
+
+async def append_twitter_chunk_async(credentials, media_id, index, chunk):
+    form = aiohttp.FormData()
+    form.add_field('command', 'APPEND')
+    form.add_field('media_id', str(media_id))
+    form.add_field('segment_index', str(index))
+    form.add_field('media', chunk, filename='chunk', content_type='application/octet-stream')
+    return await twitter_media_command_async(credentials, form, 'twitter_media_append')
+
+async def twitter_media_command_async(credentials, data, stage):
+    # Form-encoded commands (INIT, FINALIZE) are signed with their fields; multipart bodies aren't
+    form = data if isinstance(data, dict) else None
+    headers = {'Authorization': http_clients.twitter_auth_header(credentials, 'POST', TWITTER_MEDIA_UPLOAD_URL, form)}
+    response = await http_clients.async_post(TWITTER_MEDIA_UPLOAD_URL, data=data, headers=headers, stage=stage)
+    await check_response_async('twitter', credentials[2], response)
+    if not 200 <= response.status_code < 300:
+        raise Exception(f"X media upload failed ({response.status_code}): {response.text[:200]}")
+    return response.json() if response.content else {}
+
+async def create_tweet_async(credentials, text, in_reply_to_tweet_id=None, media_ids=None):
+    data = {'text': text}
+    if in_reply_to_tweet_id:
+        data['reply'] = {'in_reply_to_tweet_id': str(in_reply_to_tweet_id)}
+    if media_ids:
+        data['media'] = {'media_ids': [str(media_id) for media_id in media_ids]}
+    headers = {'Authorization': http_clients.twitter_auth_header(credentials, 'POST', TWITTER_TWEETS_URL)}
+    response = await http_clients.async_post(TWITTER_TWEETS_URL, json=data, headers=headers, stage='twitter_create_tweet')
+    await check_response_async('twitter', credentials[2], response)
+    if response.status_code != 201:
+        raise Exception(f"Failed to post tweet ({response.status_code}): {response.text[:200]}")
+    return response.json()['data']['id']
+
+async def post_to_twitter_account_async(segments, media, credentials, posted_ids=None, media_id=None, idempotency_key=None):
+    tweet_ids = list(posted_ids or [])
+    try:
+        for index, segment in enumerate(segments):
+            if index < len(tweet_ids):
+                continue
+
+            kwargs = {'text': segment}
+            if tweet_ids:
+                kwargs['in_reply_to_tweet_id'] = tweet_ids[-1]
+            elif media_id or media:
+                if not media_id:
+                    with span('twitter_call', step='media_upload'):
+                        media_id = await upload_twitter_media_async(media, credentials)
+                kwargs['media_ids'] = [media_id]
+
+            await acquire_async('twitter', credentials[2])
+            with span('twitter_call', step='create_tweet'):
+                tweet_ids.append(await call_once_async(
+                    idempotency_key and f"{idempotency_key}:{index}",
+                    lambda: create_tweet_async(credentials, **kwargs)
+                ))
+
+        return {'tweet_id': tweet_ids[0], 'tweet_ids': tweet_ids, 'media_id': media_id}
+    except TransientError as e:
+        logging.warning(f"Twitter post deferred: {str(e)}")
+        return {'error': f'Error posting to Twitter: {str(e)}', 'tweet_ids': tweet_ids, 'media_id': media_id,
+                'retryable': True, 'retry_after': e.retry_after}
+    except Exception as e:
+        logging.error(f"Error posting to Twitter: {str(e)}")
+        return {'error': f'Error posting to Twitter: {str(e)}', 'tweet_ids': tweet_ids, 'media_id': media_id}
@@ -0,0 +1,197 @@
+import io
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from pymongo.errors import PyMongoError
+from dotenv import load_dotenv
+import http_clients
+from database import db
+from media_staging import EXTENSIONS, image_content_type
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it images are stored without variants
+    Image = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# STORAGE_BACKEND=local swaps DigitalOcean Spaces for a directory on disk (tests, local runs)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'spaces')
+LOCAL_STORAGE_DIR = os.environ.get('LOCAL_STORAGE_DIR', 'local_storage')
+LOCAL_STORAGE_BASE_URL = os.environ.get('LOCAL_STORAGE_BASE_URL')
+
+# Large files go up in parallel multipart chunks instead of one long PUT
+MULTIPART_THRESHOLD = int(os.environ.get('STORAGE_MULTIPART_THRESHOLD', 8 * 1024 * 1024))
+MULTIPART_CHUNKSIZE = int(os.environ.get('STORAGE_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024))
+
+# Uploads are streamed through a spooled temp file, hashed and size-checked on the way
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 10 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_SPOOL_BYTES = 1024 * 1024
+
+# Resized copies stored next to each original, largest first (longest side in pixels)
+IMAGE_VARIANTS = [('preview', 1280), ('thumbnail', 320)]
+VARIANT_JPEG_QUALITY = 82
+
+# Stored images keyed by content hash, so identical uploads are stored once
+media_files = db['media_files']
+
+_s3 = None
+_transfer_config = None
+_s3_lock = threading.Lock()
+
+def get_s3():
+    # DigitalOcean Spaces client, built on the first upload: boto3 takes longer to import
+    # than the rest of a cold start, and most requests never store anything
+    global _s3, _transfer_config
+    with _s3_lock:
+        if _s3 is None:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            _s3 = boto3.client('s3',
+                endpoint_url=f"https://{os.environ.get('DIGITALOCEAN_SPACE_NAME')}",
+                aws_access_key_id=os.environ.get('DIGITALOCEAN_ACCESS_KEY_ID'),
+                aws_secret_access_key=os.environ.get('DIGITALOCEAN_SECRET_ACCESS_KEY')
+            )
+            _transfer_config = TransferConfig(multipart_threshold=MULTIPART_THRESHOLD,
+                                              multipart_chunksize=MULTIPART_CHUNKSIZE)
+    return _s3, _transfer_config
+
+class SpacesStorage:
+    def __init__(self, bucket, space):
+        self.bucket = bucket
+        self.base_url = f"https://{bucket}.{space}"
+
+    def upload_fileobj(self, fileobj, key, content_type=None):
+        extra_args = {'ACL': 'public-read'}
+        if content_type:
+            extra_args['ContentType'] = content_type
+        s3, transfer_config = get_s3()
+        s3.upload_fileobj(fileobj, self.bucket, key, ExtraArgs=extra_args, Config=transfer_config)
+        return f"{self.base_url}/{key}"
+
+    def is_stored(self, url):
+        return bool(url) and url.startswith(f"{self.base_url}/")
+
+class LocalStorage:
+    def __init__(self, directory, base_url=None):
+        self.directory = os.path.abspath(directory)
+        self.base_url = (base_url or f"file://{self.directory}").rstrip('/')
+
+    def upload_fileobj(self, fileobj, key, content_type=None):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, key), 'wb') as f:
+            shutil.copyfileobj(fileobj, f, MULTIPART_CHUNKSIZE)
+        return f"{self.base_url}/{key}"
+
+    def is_stored(self, url):
+        return bool(url) and url.startswith(f"{self.base_url}/")
+
+def get_storage():
+    if STORAGE_BACKEND == 'local':
+        return LocalStorage(LOCAL_STORAGE_DIR, LOCAL_STORAGE_BASE_URL)
+    return SpacesStorage(os.environ.get('DIGITALOCEAN_BUCKET_NAME'), os.environ.get('DIGITALOCEAN_SPACE_NAME'))
+
+storage = get_storage()
+
+class UploadRejected(Exception):
+    pass
+
+def spool_upload(fileobj, max_bytes=MAX_UPLOAD_BYTES):
+    # Copy a stream into a temp file, hashing as we go and stopping as soon as it is too big
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    spooled = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    while True:
+        chunk = fileobj.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            spooled.close()
+            raise UploadRejected(f"Image is larger than {max_bytes // (1024 * 1024)} MB")
+        if len(head) < 16:
+            head += chunk[:16 - len(head)]
+        digest.update(chunk)
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled, digest.hexdigest(), size, head
+
+def make_variants(fileobj, content_hash):
+    # Resize once at upload time so the dashboard never has to load the original
+    if Image is None:
+        return {}
+    variants = {}
+    try:
+        with Image.open(fileobj) as image:
+            # Let JPEG decode at reduced size when the largest variant allows it
+            image.draft('RGB', (IMAGE_VARIANTS[0][1], IMAGE_VARIANTS[0][1]))
+            resized = image.convert('RGB')
+        for name, size in IMAGE_VARIANTS:
+            resized.thumbnail((size, size))
+            buffer = io.BytesIO()
+            resized.save(buffer, 'JPEG', quality=VARIANT_JPEG_QUALITY, optimize=True)
+            buffer.seek(0)
+            variants[name] = storage.upload_fileobj(buffer, f"{content_hash}_{name}.jpg", 'image/jpeg')
+    except Exception as e:
+        logger.warning(f"Failed to create image variants for {content_hash}: {str(e)}")
+    return variants
+
+def store_image(fileobj):
+    # Store an image stream once per distinct content; returns {'url', 'variants', ...}
+    spooled, content_hash, size, head = spool_upload(fileobj)
+    with spooled:
+        content_type = image_content_type(head)
+        if not content_type:
+            raise UploadRejected("Unsupported image type, expected PNG, JPEG, GIF or WebP")
+
+        try:
+            existing = media_files.find_one({'_id': content_hash})
+        except PyMongoError as e:
+            logger.warning(f"Failed to look up stored image: {str(e)}")
+            existing = None
+        if existing:
+            logger.info(f"Image {content_hash} already stored, reusing {existing['url']}")
+            return existing
+
+        record = {
+            '_id': content_hash,
+            'content_type': content_type,
+            'size': size,
+            'url': storage.upload_fileobj(spooled, f"{content_hash}{EXTENSIONS[content_type]}", content_type)
+        }
+        spooled.seek(0)
+        record['variants'] = make_variants(spooled, content_hash)
+
+    try:
+        media_files.update_one({'_id': content_hash}, {'$setOnInsert': record}, upsert=True)
+    except PyMongoError as e:
+        logger.warning(f"Failed to record stored image: {str(e)}")
+    return record
+
+def upload_to_digitalocean(file):
+    from botocore.exceptions import NoCredentialsError
+    try:
+        return store_image(file.stream)
+    except NoCredentialsError:
+        logger.error("DigitalOcean credentials not available")
+        return None
+
+def mirror_image(image_url):
+    # Stream a remote image (e.g. an ephemeral Ideogram URL) into storage and return its record
+    if storage.is_stored(image_url):
+        return {'url': image_url}
+
+    with http_clients.get(image_url, stream=True, stage='image_mirror') as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        record = store_image(response.raw)
+
+    logger.info(f"Mirrored {image_url} to {record['url']}")
+    return record
@@ -0,0 +1,111 @@
+import re
+
+# X counts text by weighted length: most Latin-range code points weigh 1, everything
+# else (CJK, emoji, ...) weighs 2, and every URL counts as 23 regardless of its length
+MAX_TWEET_LENGTH = 280
+URL_LENGTH = 23
+LIGHT_RANGES = ((0, 4351), (8192, 8205), (8208, 8223), (8242, 8247))
+
+URL_RE = re.compile(r'https?://\S+', re.IGNORECASE)
+HEAVY_RE = re.compile('[^' + ''.join(f'{chr(start)}-{chr(end)}' for start, end in LIGHT_RANGES) + ']')
+PARAGRAPH_RE = re.compile(r'(\n\s*\n)')
+SENTENCE_RE = re.compile(r'(?<=[.!?…])(\s+)')
+WORD_RE = re.compile(r'(\s+)')
+
+def char_weight(char):
+    code_point = ord(char)
+    for start, end in LIGHT_RANGES:
+        if start <= code_point <= end:
+            return 1
+    return 2
+
+def text_weight(text):
+    return len(text) + len(HEAVY_RE.findall(text))
+
+def weighted_length(text):
+    if '://' not in text:
+        return text_weight(text)
+    length = 0
+    position = 0
+    for match in URL_RE.finditer(text):
+        length += text_weight(text[position:match.start()]) + URL_LENGTH
+        position = match.end()
+    return length + text_weight(text[position:])
+
+def hard_split(word, limit):
+    # Last resort for a single token longer than a tweet
+    chunk, chunk_length = '', 0
+    for char in word:
+        weight = char_weight(char)
+        if chunk and chunk_length + weight > limit:
+            yield chunk
+            chunk, chunk_length = '', 0
+        chunk += char
+        chunk_length += weight
+    if chunk:
+        yield chunk
+
+def split_with_separators(regex, text, first_separator):
+    # Yield (separator, piece) pairs, keeping the original whitespace between pieces
+    pieces = regex.split(text)
+    yield first_separator, pieces[0]
+    for index in range(1, len(pieces), 2):
+        yield pieces[index], pieces[index + 1]
+
+def iter_chunks(text, limit):
+    # Yield (separator, chunk, weighted length) using the coarsest boundary that fits:
+    # paragraphs, then sentences, then words
+    for separator, paragraph in split_with_separators(PARAGRAPH_RE, text, ''):
+        length = weighted_length(paragraph)
+        if length <= limit:
+            yield separator, paragraph, length
+            continue
+        for sentence_separator, sentence in split_with_separators(SENTENCE_RE, paragraph, separator):
+            length = weighted_length(sentence)
+            if length <= limit:
+                yield sentence_separator, sentence, length
+                continue
+            for word_separator, word in split_with_separators(WORD_RE, sentence, sentence_separator):
+                length = weighted_length(word)
+                if length <= limit:
+                    yield word_separator, word, length
+                    continue
+                for piece_index, piece in enumerate(hard_split(word, limit)):
+                    yield (word_separator if piece_index == 0 else ''), piece, weighted_length(piece)
+
+def pack(text, limit):
+    segments = []
+    current, current_length = '', 0
+    for separator, chunk, length in iter_chunks(text, limit):
+        separator_length = weighted_length(separator)
+        if current and current_length + separator_length + length <= limit:
+            current += separator + chunk
+            current_length += separator_length + length
+        else:
+            if current:
+                segments.append(current)
+            current, current_length = chunk, length
+    if current:
+        segments.append(current)
+    return segments
+
+def split_thread(text, limit=MAX_TWEET_LENGTH, numbered=True):
+    # Deterministically split text into tweets; numbered threads end each tweet with " i/n"
+    text = text.strip()
+    if weighted_length(text) <= limit:
+        return [text]
+
+    if not numbered:
+        return pack(text, limit)
+
+    # Reserve room for the " i/n" suffix, growing the reservation if the count needs more digits
+    digits = 1
+    while True:
+        reserve = len(f" {'9' * digits}/{'9' * digits}")
+        segments = pack(text, limit - reserve)
+        if len(str(len(segments))) <= digits:
+            break
+        digits += 1
+
+    total = len(segments)
+    return [f"{segment} {index}/{total}" for index, segment in enumerate(segments, start=1)]
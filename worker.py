@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import signal
+import threading
+from dotenv import load_dotenv
+from job_queue import claim_next_post, process_post, worker_id
+from image_jobs import generate_pending_images
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(threadName)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger(__name__)
+
+WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', 2))
+WORKER_POLL_SECONDS = float(os.environ.get('WORKER_POLL_SECONDS', 15))
+
+def consume(stop_event, poll_seconds):
+    owner = worker_id()
+    logger.info(f"Consumer {owner} started")
+    while not stop_event.is_set():
+        try:
+            post = claim_next_post(owner)
+        except Exception as e:
+            logger.error(f"Failed to claim post: {str(e)}", exc_info=True)
+            post = None
+
+        if post:
+            process_post(post, owner)
+            continue
+
+        # Use idle time for deferred image generation
+        try:
+            if generate_pending_images():
+                continue
+        except Exception as e:
+            logger.error(f"Failed to generate pending images: {str(e)}", exc_info=True)
+        stop_event.wait(poll_seconds)
+    logger.info(f"Consumer {owner} stopped")
+
+def main():
+    parser = argparse.ArgumentParser(description='Publish scheduled posts from the MongoDB job queue')
+    parser.add_argument('--concurrency', type=int, default=WORKER_CONCURRENCY, help='number of concurrent consumers')
+    parser.add_argument('--poll-seconds', type=float, default=WORKER_POLL_SECONDS, help='idle wait between queue polls')
+    args = parser.parse_args()
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    consumers = [
+        threading.Thread(target=consume, args=(stop_event, args.poll_seconds), name=f"consumer-{i+1}")
+        for i in range(args.concurrency)
+    ]
+    for consumer in consumers:
+        consumer.start()
+    logger.info(f"Worker started with {args.concurrency} consumer(s)")
+
+    try:
+        while any(consumer.is_alive() for consumer in consumers):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info("Shutting down worker...")
+        stop_event.set()
+        for consumer in consumers:
+            consumer.join()
+
+if __name__ == '__main__':
+    main()